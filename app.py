@@ -2,13 +2,13 @@ import streamlit as st
 import sys
 import os
 
-# Add project root to path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Add project root to path (Streamlit 每次 rerun 都會重跑此檔，避免重複插入)
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
 
 import config
 from services.product_data import load_products, sync_products_from_source
-from views.quote import render_quote_page
-from views.history_page import render_history_page
 
 st.set_page_config(
     page_title="運費報價系統 Shipping Quote",
@@ -33,20 +33,17 @@ with st.sidebar:
     st.divider()
     st.subheader("FedEx 設定 Settings")
 
-    fedex_account = st.text_input(
+    # 以 key 綁定 session_state，報價頁直接讀 st.session_state["fedex_account"]
+    st.session_state.setdefault("fedex_account", config.FEDEX_ACCOUNT_NUMBER)
+    st.text_input(
         "FedEx 帳號 Account No. (9碼 digits)",
-        value=config.FEDEX_ACCOUNT_NUMBER,
+        key="fedex_account",
         type="password",
         help="在 FedEx 帳單或 Developer Portal 上可找到的 9 位數帳號 / 9-digit account number found on FedEx invoice or Developer Portal",
     )
-    st.session_state["fedex_account"] = fedex_account
 
     # Show environment info
-    base_url = config.FEDEX_BASE_URL
-    if "sandbox" in base_url:
-        st.caption("🟡 測試環境 Sandbox")
-    else:
-        st.caption("🟢 正式環境 Production")
+    st.caption(config.ENV_CAPTION)
 
     st.divider()
     if st.button("同步產品資料 Sync Products", use_container_width=True):
@@ -54,23 +51,21 @@ with st.sidebar:
             try:
                 count = sync_products_from_source()
                 st.success(f"同步完成！{count} 筆資料 Synced!")
-                st.cache_data.clear()
             except Exception as e:
                 st.error(f"同步失敗 Sync failed: {e}")
 
 # ── Load product data ──
-@st.cache_data(ttl=600)
-def cached_load_products():
-    return load_products()
-
 try:
-    products = cached_load_products()
+    products = load_products()
 except Exception as e:
     st.error(f"載入產品資料失敗 Failed to load product data: {e}")
     st.stop()
 
 # ── Render page ──
+# 頁面模組延後到選到該頁才匯入，只看報價頁時不必載入歷史頁的 pandas/openpyxl 依賴
 if page == "運費報價 Quote":
+    from views.quote import render_quote_page
     render_quote_page(products)
 elif page == "歷史紀錄 History":
+    from views.history_page import render_history_page
     render_history_page()
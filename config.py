@@ -1,19 +1,34 @@
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
 
-# Load .env from project root (local development)
-load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_PARENT = os.path.dirname(_HERE)
 
+ENV_PATH = os.path.join(_HERE, ".env")
 
-def _get_secret(key: str, default: str = "") -> str:
-    """優先從 Streamlit secrets 讀取，再從環境變數讀取"""
-    # 嘗試 Streamlit secrets（Streamlit Cloud 部署時）
+# Load .env from project root (local development), once per process
+if not os.environ.get("_SHIPQUOTE_DOTENV_LOADED"):
+    load_dotenv(ENV_PATH)
+    os.environ["_SHIPQUOTE_DOTENV_LOADED"] = "1"
+
+
+@lru_cache(maxsize=1)
+def _streamlit_secrets() -> dict:
+    """讀取一次 Streamlit secrets（Streamlit Cloud 部署時），沒有則回傳空 dict"""
     try:
         import streamlit as st
-        if hasattr(st, "secrets") and key in st.secrets:
-            return str(st.secrets[key])
+        return dict(st.secrets)
     except Exception:
-        pass
+        return {}
+
+
+@lru_cache(maxsize=None)
+def _get_secret(key: str, default: str = "") -> str:
+    """優先從 Streamlit secrets 讀取，再從環境變數讀取"""
+    secrets = _streamlit_secrets()
+    if key in secrets:
+        return str(secrets[key])
     # 本機開發：從 .env / 環境變數
     return os.getenv(key, default)
 
@@ -22,6 +37,8 @@ FEDEX_API_KEY = _get_secret("FEDEX_API_KEY")
 FEDEX_SECRET_KEY = _get_secret("FEDEX_SECRET_KEY")
 FEDEX_ACCOUNT_NUMBER = _get_secret("FEDEX_ACCOUNT_NUMBER")
 FEDEX_BASE_URL = _get_secret("FEDEX_BASE_URL", "https://apis.fedex.com")
+IS_SANDBOX = "sandbox" in FEDEX_BASE_URL
+ENV_CAPTION = "🟡 測試環境 Sandbox" if IS_SANDBOX else "🟢 正式環境 Production"
 
 # Shippo API (domestic shipping)
 SHIPPO_API_TOKEN = _get_secret("SHIPPO_API_TOKEN")
@@ -85,18 +102,14 @@ DEFAULT_MARKUP_PERCENT = 15
 DEFAULT_EXCHANGE_RATE = 28  # NTD per USD
 
 # Data paths (local fallback)
-DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DATA_DIR = os.path.join(_HERE, "data")
 PRODUCTS_JSON = os.path.join(DATA_DIR, "products.json")
 HISTORY_CSV = os.path.join(DATA_DIR, "quote_history.csv")
 
 # Google Sheets 設定
 GOOGLE_SHEETS_KEY_FILE = os.getenv(
     "GOOGLE_SHEETS_KEY_FILE",
-    os.path.join(
-        os.path.dirname(os.path.abspath(__file__)),
-        "..",
-        "shipping-quote-486901-dbd435d38327.json",
-    ),
+    os.path.join(_PARENT, "shipping-quote-486901-dbd435d38327.json"),
 )
 GOOGLE_SHEETS_SPREADSHEET_ID = _get_secret(
     "GOOGLE_SHEETS_SPREADSHEET_ID",
@@ -13,6 +13,7 @@
 import re
 import sys
 import os
+from itertools import zip_longest
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
@@ -28,6 +29,8 @@ SKIP_PATTERNS = [
     "檔環", "DISPLAY", "Demo", "木門", "格柵",
     "ADA HANDLE", "背板", "SA1", "SA.", "HS.",
 ]
+# 所有排除字串合併成一個 regex，一次掃描即可判斷
+_SKIP_RE = re.compile("|".join(map(re.escape, SKIP_PATTERNS)))
 
 HEADER = ["產品型號", "sets_per_carton", "weight_kg"]
 
@@ -44,9 +47,8 @@ def parse_sets_per_carton(raw):
 
 def should_skip(model: str) -> bool:
     """Check if model should be excluded"""
-    for pat in SKIP_PATTERNS:
-        if pat in model:
-            return True
+    if _SKIP_RE.search(model):
+        return True
     # Skip multiline or obviously non-product entries
     if "\n" in model or len(model) > 30:
         return True
@@ -56,31 +58,31 @@ def should_skip(model: str) -> bool:
 def extract_products():
     """Extract product data from Excel files"""
     print("讀取 Excel 檔案...")
-    wb_orig = openpyxl.load_workbook(ORIGINAL_FILE, data_only=True)
+    # read_only：串流讀取，不建立整本活頁簿的儲存格物件
+    wb_orig = openpyxl.load_workbook(ORIGINAL_FILE, data_only=True, read_only=True)
     ws_orig = wb_orig["重量明細"]
 
-    wb_corr = openpyxl.load_workbook(CORRECTED_FILE, data_only=False)
+    wb_corr = openpyxl.load_workbook(CORRECTED_FILE, data_only=False, read_only=True)
     ws_corr = wb_corr["重量明細"]
 
-    max_row = ws_orig.max_row
-
-    # ── Pass 1: Collect base inner weight per (model, G) from I=1 rows ──
-    base_weights = {}  # (corrected_model, G) -> inner_box_weight
-    for row_idx in range(3, max_row + 1):
-        model_corr = ws_corr[f"C{row_idx}"].value
+    # ── Single sweep: read both sheets row by row (from row 3) ──
+    # 原始檔取 G..N 欄的計算值，修正檔取 C 欄的型號
+    records = []  # (model_corr, g_int, i_val, l_val, m_val, n_val)
+    orig_rows = ws_orig.iter_rows(min_row=3, min_col=7, max_col=14, values_only=True)
+    corr_rows = ws_corr.iter_rows(min_row=3, min_col=3, max_col=3, values_only=True)
+    for orig, corr in zip_longest(orig_rows, corr_rows):
+        if orig is None:
+            break  # 只處理原始檔範圍內的列
+        model_corr = corr[0] if corr else None
         if not model_corr or not isinstance(model_corr, str):
             continue
         model_corr = model_corr.strip()
         if should_skip(model_corr):
             continue
 
-        g = ws_orig[f"G{row_idx}"].value
-        i_val = parse_sets_per_carton(ws_orig[f"I{row_idx}"].value)
-        l_val = ws_orig[f"L{row_idx}"].value
-
-        if g is None or i_val is None or i_val != 1:
-            continue
-        if l_val is None or not isinstance(l_val, (int, float)):
+        g, _, i_raw, _, _, l_val, m_val, n_val = orig
+        i_val = parse_sets_per_carton(i_raw)
+        if g is None or i_val is None:
             continue
 
         try:
@@ -88,39 +90,34 @@ def extract_products():
         except (ValueError, TypeError):
             continue
 
-        key = (model_corr, g_int)
-        base_weights[key] = float(l_val)
+        records.append((model_corr, g_int, i_val, l_val, m_val, n_val))
 
-    print(f"收集到 {len(base_weights)} 組基礎內盒重量")
+    # 已全部讀入記憶體，釋放 zip 檔案控制代碼
+    wb_orig.close()
+    wb_corr.close()
 
-    # ── Pass 2: Extract all valid rows ──
-    rows = []
-    fixed_count = 0
-    skipped_count = 0
-
-    for row_idx in range(3, max_row + 1):
-        model_corr = ws_corr[f"C{row_idx}"].value
-        if not model_corr or not isinstance(model_corr, str):
+    # ── Pass 1: Collect base inner weight per (model, G) from I=1 rows ──
+    base_weights = {}  # (corrected_model, G) -> inner_box_weight
+    for model_corr, g_int, i_val, l_val, _, _ in records:
+        if i_val != 1:
             continue
-        model_corr = model_corr.strip()
-        if should_skip(model_corr):
+        if l_val is None or not isinstance(l_val, (int, float)):
             continue
+        base_weights[(model_corr, g_int)] = float(l_val)
 
-        g = ws_orig[f"G{row_idx}"].value
-        i_val = parse_sets_per_carton(ws_orig[f"I{row_idx}"].value)
+    print(f"收集到 {len(base_weights)} 組基礎內盒重量")
 
-        if g is None or i_val is None or i_val <= 0:
-            continue
+    # ── Pass 2: Extract all valid rows ──
+    # Deduplicate while collecting (same model + same sets_per_carton → keep first)
+    unique = {}  # (model, sets_per_carton) -> [model, sets_per_carton, weight]
+    valid_count = 0
+    fixed_count = 0
+    skipped_count = 0
 
-        try:
-            g_int = int(float(g))
-        except (ValueError, TypeError):
+    for model_corr, g_int, i_val, l_val, m_val, n_val in records:
+        if i_val <= 0:
             continue
 
-        l_val = ws_orig[f"L{row_idx}"].value
-        m_val = ws_orig[f"M{row_idx}"].value
-        n_val = ws_orig[f"N{row_idx}"].value
-
         # Determine total weight per carton
         weight = None
 
@@ -146,29 +143,18 @@ def extract_products():
             skipped_count += 1
             continue
 
-        rows.append([model_corr, i_val, weight])
+        valid_count += 1
+        unique.setdefault((model_corr, i_val), [model_corr, i_val, weight])
 
-    print(f"提取完成: {len(rows)} 筆有效資料")
+    print(f"提取完成: {valid_count} 筆有效資料")
     print(f"修復 N 值: {fixed_count} 筆")
     print(f"跳過無效: {skipped_count} 筆")
 
-    # ── Deduplicate (same model + same sets_per_carton → keep first) ──
-    seen = set()
-    unique_rows = []
-    for row in rows:
-        key = (row[0], row[1])
-        if key not in seen:
-            seen.add(key)
-            unique_rows.append(row)
-        # If duplicate, skip silently (same model+packing combo)
-
-    if len(unique_rows) < len(rows):
-        print(f"去重: {len(rows)} → {unique_rows.__len__()} 筆（移除 {len(rows) - len(unique_rows)} 筆重複）")
+    if len(unique) < valid_count:
+        print(f"去重: {valid_count} → {len(unique)} 筆（移除 {valid_count - len(unique)} 筆重複）")
 
     # Sort by model name, then sets_per_carton
-    unique_rows.sort(key=lambda r: (r[0], r[1]))
-
-    return unique_rows
+    return sorted(unique.values(), key=lambda r: (r[0], r[1]))
 
 
 def upload_to_sheets(rows):
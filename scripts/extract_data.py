@@ -1,6 +1,7 @@
 """
 從 2026 PACKING LIST.xlsx 的「重量明細」sheet 擷取產品資料，產出 products.json
 執行一次即可：python scripts/extract_data.py
+（有安裝 python-calamine 時用它讀 Excel，較快；否則用 openpyxl）
 """
 import json
 import re
@@ -11,6 +12,12 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import openpyxl
 
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+SHEET_NAME = "重量明細"
 EXCEL_PATH = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
     "..",
@@ -22,6 +29,8 @@ OUTPUT_PATH = os.path.join(
     "products.json",
 )
 
+_NUM_RE = re.compile(r"(\d+\.?\d*)")
+
 
 def extract_number(value):
     """從混合文字中擷取數字，例如 '5 (滿箱)' → 5, '2 (SA.HS)' → 2"""
@@ -29,28 +38,43 @@ def extract_number(value):
         return None
     if isinstance(value, (int, float)):
         return float(value)
-    match = re.search(r"(\d+\.?\d*)", str(value))
+    match = _NUM_RE.search(str(value))
     if match:
         return float(match.group(1))
     return None
 
 
-def extract_products():
-    wb = openpyxl.load_workbook(EXCEL_PATH, data_only=True)
-    ws = wb["重量明細"]
+def iter_sheet_rows():
+    """逐列產生「重量明細」第 2 列起 A..N 欄的值（空白儲存格為 None）"""
+    if CalamineWorkbook is not None:
+        sheet = CalamineWorkbook.from_path(EXCEL_PATH).get_sheet_by_name(SHEET_NAME)
+        # skip_empty_area=False：保留開頭空白列，列號才會與 Excel 對齊
+        for row in sheet.to_python(skip_empty_area=False)[1:]:
+            yield tuple(None if v == "" else v for v in row[:14])
+        return
+
+    # read_only：串流讀取，只取 A..N 欄的值，不建立 Cell 物件
+    wb = openpyxl.load_workbook(EXCEL_PATH, data_only=True, read_only=True)
+    try:
+        yield from wb[SHEET_NAME].iter_rows(min_row=2, max_col=14, values_only=True)
+    finally:
+        wb.close()
 
+
+def extract_products():
     products = {}
+    seen = {}  # (model, sets_per_carton) -> [stored weight_kg]
     current_model = None
 
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
+    for row in iter_sheet_rows():
         # Column C = model name (index 2)
-        model_cell = row[2].value if len(row) > 2 else None
+        model_cell = row[2] if len(row) > 2 else None
         # Column I = boxes/sets per carton (index 8)
-        sets_cell = row[8].value if len(row) > 8 else None
+        sets_cell = row[8] if len(row) > 8 else None
         # Column J = old gross weight (index 9)
-        old_weight_cell = row[9].value if len(row) > 9 else None
+        old_weight_cell = row[9] if len(row) > 9 else None
         # Column N = new gross weight (index 13)
-        new_weight_cell = row[13].value if len(row) > 13 else None
+        new_weight_cell = row[13] if len(row) > 13 else None
 
         # Update current model if column C has a value
         if model_cell is not None:
@@ -82,14 +106,10 @@ def extract_products():
         if current_model not in products:
             products[current_model] = []
 
-        # Avoid duplicate entries
-        existing = [
-            opt
-            for opt in products[current_model]
-            if opt["sets_per_carton"] == sets_per_carton
-            and abs(opt["weight_kg"] - weight) < 0.01
-        ]
-        if not existing:
+        # Avoid duplicate entries: same sets and a stored weight within 0.01 kg
+        stored = seen.setdefault((current_model, sets_per_carton), [])
+        if not any(abs(w - weight) < 0.01 for w in stored):
+            stored.append(round(weight, 2))
             products[current_model].append(
                 {
                     "sets_per_carton": sets_per_carton,
@@ -104,6 +124,19 @@ def extract_products():
     return products
 
 
+def write_products_json(products, path):
+    """逐個型號寫出 JSON（每個型號一行、緊湊格式），不先組出整份縮排字串"""
+    items = sorted(products.items())
+    last = len(items) - 1
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        for i, (model, options) in enumerate(items):
+            key = json.dumps(model, ensure_ascii=False)
+            value = json.dumps(options, ensure_ascii=False, separators=(",", ":"))
+            f.write(f"  {key}: {value}{',' if i < last else ''}\n")
+        f.write("}\n")
+
+
 def main():
     print("正在從 Excel 擷取產品資料...")
     products = extract_products()
@@ -112,8 +145,7 @@ def main():
     # Ensure output directory exists
     os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
 
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-        json.dump(products, f, ensure_ascii=False, indent=2)
+    write_products_json(products, OUTPUT_PATH)
 
     print(f"已儲存至 {OUTPUT_PATH}")
 
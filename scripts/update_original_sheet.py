@@ -11,7 +11,10 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 import config
-from services.google_sheets import get_gspread_client
+from services.google_sheets import get_gspread_client, group_contiguous_rows
+
+_G_NUM_RE = re.compile(r"(\d+)")       # G 欄開頭的數字，例如 '2  PCS' -> 2
+_X_SUFFIX_RE = re.compile(r"-X\d+")    # 已有 -X 後綴
 
 
 def main():
@@ -39,7 +42,7 @@ def main():
             continue
 
         # Extract number from G (e.g. '2  PCS' -> 2)
-        g_match = re.match(r"(\d+)", g_val)
+        g_match = _G_NUM_RE.match(g_val)
         if not g_match:
             d_values.append([c_val])
             continue
@@ -47,7 +50,7 @@ def main():
         g_num = int(g_match.group(1))
 
         # Check if already has -X suffix
-        if re.search(r"-X\d+", c_val):
+        if _X_SUFFIX_RE.search(c_val):
             d_values.append([c_val])
             continue
 
@@ -62,16 +65,16 @@ def main():
     print(f"D 欄已更新: {len(d_values)} 列")
     print(f"有修改的列: {len(modified_rows)} 列")
 
-    # Format modified cells in red bold
+    # Format modified cells in red bold（連續的列合併成一個 range）
     requests = []
-    for row_idx in modified_rows:
+    for start, end in group_contiguous_rows(modified_rows):
         requests.append(
             {
                 "repeatCell": {
                     "range": {
                         "sheetId": ws.id,
-                        "startRowIndex": row_idx,
-                        "endRowIndex": row_idx + 1,
+                        "startRowIndex": start,
+                        "endRowIndex": end,
                         "startColumnIndex": 3,  # Column D
                         "endColumnIndex": 4,
                     },
@@ -94,7 +97,7 @@ def main():
 
     if requests:
         spreadsheet.batch_update({"requests": requests})
-        print(f"已將 {len(requests)} 個儲存格設為紅色粗體")
+        print(f"已將 {len(modified_rows)} 個儲存格設為紅色粗體（{len(requests)} 個區段）")
 
     # Show sample
     print("\n=== 前 20 筆對照 ===")
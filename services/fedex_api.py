@@ -1,10 +1,45 @@
+import threading
 import requests
+import streamlit as st
+from dataclasses import dataclass
 from datetime import date, datetime, timedelta
+from operator import itemgetter
 import config
 
 
-# Token cache
-_token_cache = {"token": None, "expires_at": None}
+# Token cache: account_number -> (token, expires_at)
+_token_cache = {}
+_token_lock = threading.Lock()
+
+# Rate request 中固定不變的部分，只建立一次（唯讀，各次請求共用同一物件）
+_RATE_REQUEST_CONTROL = {
+    "returnTransitTimes": True,
+    "rateSortOrder": "COMMITASCENDING",
+}
+_RATE_REQUEST_TYPE = ["LIST"]
+_SHIPPER = {"address": config.SENDER_ADDRESS}
+_COMMODITY_BASE = {
+    "description": "Door Hardware",
+    "countryOfManufacture": "TW",
+    "quantity": 1,
+    "quantityUnits": "PCS",
+    "customsValue": {
+        "amount": 100.00,
+        "currency": "USD",
+    },
+}
+
+# 共用 HTTP session：保持連線（keep-alive），後續請求不必重新做 TCP/TLS 握手
+_session = requests.Session()
+
+
+@dataclass(frozen=True, slots=True)
+class Destination:
+    """美國收件地址（不可變、可雜湊，可直接作為 st.cache_data 的快取鍵）"""
+    postal_code: str = ""
+    state_code: str = ""
+    city: str = ""
+    street: str = ""
 
 
 def lookup_zip_code(city: str, state: str) -> str:
@@ -13,7 +48,7 @@ def lookup_zip_code(city: str, state: str) -> str:
         return ""
     try:
         url = f"https://api.zippopotam.us/us/{state}/{city}"
-        resp = requests.get(url, timeout=10)
+        resp = _session.get(url, timeout=10)
         if resp.status_code == 200:
             places = resp.json().get("places", [])
             if places:
@@ -25,46 +60,50 @@ def lookup_zip_code(city: str, state: str) -> str:
 
 def get_oauth_token(account_number=None, force_refresh=False) -> str:
     """
-    取得 FedEx OAuth access token（自動快取 55 分鐘）
+    取得 FedEx OAuth access token（依帳號分別快取 55 分鐘）
     帶上 account_number 以取得帳號綁定的 token
     """
-    now = datetime.now()
-    if (
-        not force_refresh
-        and _token_cache["token"]
-        and _token_cache["expires_at"]
-        and now < _token_cache["expires_at"]
-    ):
-        return _token_cache["token"]
-
-    url = f"{config.FEDEX_BASE_URL}/oauth/token"
-    payload = {
-        "grant_type": "client_credentials",
-        "client_id": config.FEDEX_API_KEY,
-        "client_secret": config.FEDEX_SECRET_KEY,
-    }
-    if account_number:
-        payload["account_number"] = account_number
-    elif config.FEDEX_ACCOUNT_NUMBER:
-        payload["account_number"] = config.FEDEX_ACCOUNT_NUMBER
+    account = account_number or config.FEDEX_ACCOUNT_NUMBER or ""
+
+    if not force_refresh:
+        cached = _token_cache.get(account)
+        if cached and datetime.now() < cached[1]:
+            return cached[0]
+
+    # 同一時間只讓一個 thread 換 token；拿到鎖後再檢查一次，別的 thread 可能剛換好
+    with _token_lock:
+        now = datetime.now()
+        cached = _token_cache.get(account)
+        if not force_refresh and cached and now < cached[1]:
+            return cached[0]
+
+        url = f"{config.FEDEX_BASE_URL}/oauth/token"
+        payload = {
+            "grant_type": "client_credentials",
+            "client_id": config.FEDEX_API_KEY,
+            "client_secret": config.FEDEX_SECRET_KEY,
+        }
+        if account:
+            payload["account_number"] = account
 
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
 
-    response = requests.post(url, data=payload, headers=headers, timeout=30)
-    response.raise_for_status()
+        response = _session.post(url, data=payload, headers=headers, timeout=30)
+        response.raise_for_status()
 
-    data = response.json()
-    _token_cache["token"] = data["access_token"]
-    _token_cache["expires_at"] = now + timedelta(seconds=data.get("expires_in", 3600) - 300)
+        data = response.json()
+        token = data["access_token"]
+        _token_cache[account] = (token, now + timedelta(seconds=data.get("expires_in", 3600) - 300))
 
-    return _token_cache["token"]
+    return token
 
 
+@st.cache_data(ttl=900, show_spinner=False)
 def get_rate_quote(
     account_number: str,
     total_weight_kg: float,
     num_packages: int,
-    destination: dict,
+    destination: Destination,
 ) -> dict:
     """
     查詢 FedEx 國際運費
@@ -73,15 +112,11 @@ def get_rate_quote(
         account_number: FedEx 9位數帳號
         total_weight_kg: 總重量(kg)
         num_packages: 總箱數
-        destination: {
-            "postal_code": "90001",
-            "state_code": "CA",      # 選填
-            "city": "Los Angeles",   # 選填
-            "street": ""             # 選填
-        }
+        destination: Destination(postal_code="90001", state_code="CA", city="Los Angeles", street="")
+            state_code / city / street 選填
 
     Returns:
-        FedEx API raw response dict
+        FedEx API raw response dict（相同參數 15 分鐘內直接回傳快取結果）
     """
     token = get_oauth_token(account_number=account_number)
     url = f"{config.FEDEX_BASE_URL}/rate/v1/rates/quotes"
@@ -93,46 +128,41 @@ def get_rate_quote(
     }
 
     # Auto-lookup ZIP if missing but city + state available
-    postal_code = destination.get("postal_code") or ""
-    if not postal_code and destination.get("city") and destination.get("state_code"):
-        postal_code = lookup_zip_code(destination["city"], destination["state_code"])
+    postal_code = destination.postal_code or ""
+    if not postal_code and destination.city and destination.state_code:
+        postal_code = lookup_zip_code(destination.city, destination.state_code)
 
     # Build recipient address
     recipient_address = {
         "countryCode": "US",
         "residential": False,
         "postalCode": postal_code,
-        "stateOrProvinceCode": destination.get("state_code") or "",
-        "city": destination.get("city") or "",
+        "stateOrProvinceCode": destination.state_code or "",
+        "city": destination.city or "",
     }
-    street = destination.get("street") or ""
+    street = destination.street or ""
     recipient_address["streetLines"] = [street] if street else [""]
 
     # Weight per package
     weight_per_pkg = round(total_weight_kg / num_packages, 2)
 
-    # Build package line items
-    package_line_items = []
-    for _ in range(num_packages):
-        package_line_items.append(
-            {
-                "subPackagingType": "BOX",
-                "groupPackageCount": 1,
-                "weight": {"units": "KG", "value": weight_per_pkg},
-            }
-        )
+    # 每箱重量相同，用一個 line item + groupPackageCount 描述全部箱數
+    package_line_items = [
+        {
+            "subPackagingType": "BOX",
+            "groupPackageCount": num_packages,
+            "weight": {"units": "KG", "value": weight_per_pkg},
+        }
+    ]
 
     payload = {
         "accountNumber": {"value": account_number},
-        "rateRequestControlParameters": {
-            "returnTransitTimes": True,
-            "rateSortOrder": "COMMITASCENDING",
-        },
+        "rateRequestControlParameters": _RATE_REQUEST_CONTROL,
         "requestedShipment": {
-            "shipper": {"address": config.SENDER_ADDRESS},
+            "shipper": _SHIPPER,
             "recipient": {"address": recipient_address},
             "pickupType": "DROPOFF_AT_FEDEX_LOCATION",
-            "rateRequestType": ["LIST"],
+            "rateRequestType": _RATE_REQUEST_TYPE,
             "requestedPackageLineItems": package_line_items,
             "packagingType": "YOUR_PACKAGING",
             "totalPackageCount": num_packages,
@@ -140,31 +170,24 @@ def get_rate_quote(
             "customsClearanceDetail": {
                 "commodities": [
                     {
-                        "description": "Door Hardware",
-                        "countryOfManufacture": "TW",
-                        "quantity": 1,
-                        "quantityUnits": "PCS",
+                        **_COMMODITY_BASE,
                         "weight": {
                             "units": "KG",
                             "value": total_weight_kg,
                         },
-                        "customsValue": {
-                            "amount": 100.00,
-                            "currency": "USD",
-                        },
                     }
                 ],
             },
         },
     }
 
-    response = requests.post(url, json=payload, headers=headers, timeout=60)
+    response = _session.post(url, json=payload, headers=headers, timeout=60)
 
     # If 401, retry with fresh token
     if response.status_code == 401:
         token = get_oauth_token(account_number=account_number, force_refresh=True)
         headers["Authorization"] = f"Bearer {token}"
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
+        response = _session.post(url, json=payload, headers=headers, timeout=60)
 
     response.raise_for_status()
     return response.json()
@@ -184,9 +207,8 @@ def parse_rate_response(response_json: dict) -> list[dict]:
             "delivery_date": str,
         }
     """
-    from datetime import datetime as dt
-
-    raw_results = []
+    today = date.today()
+    best_by_type = {}  # service_type -> 同服務最便宜的方案
     rate_details = response_json.get("output", {}).get("rateReplyDetails", [])
 
     for detail in rate_details:
@@ -194,17 +216,17 @@ def parse_rate_response(response_json: dict) -> list[dict]:
 
         # Get the best rate (ACCOUNT rate preferred over LIST)
         rated_details = detail.get("ratedShipmentDetails", [])
-        best_rate = None
-        for rd in rated_details:
-            if rd.get("rateType") == "ACCOUNT":
-                best_rate = rd
-                break
-        if best_rate is None and rated_details:
-            best_rate = rated_details[0]
+        best_rate = next(
+            (rd for rd in rated_details if rd.get("rateType") == "ACCOUNT"),
+            rated_details[0] if rated_details else None,
+        )
         if best_rate is None:
             continue
 
         total_charge = float(best_rate.get("totalNetCharge", 0))
+        prev = best_by_type.get(service_type)
+        if prev is not None and total_charge >= prev["total_charge"]:
+            continue  # Deduplicate: keep cheapest per service_type
         currency = best_rate.get("currency", "TWD")
 
         # Transit time from commit.dateDetail
@@ -216,30 +238,21 @@ def parse_rate_response(response_json: dict) -> list[dict]:
         transit_days = "N/A"
         if delivery_date_str:
             try:
-                delivery_dt = dt.fromisoformat(delivery_date_str)
-                days = (delivery_dt.date() - date.today()).days
+                delivery_dt = datetime.fromisoformat(delivery_date_str)
+                days = (delivery_dt.date() - today).days
                 transit_days = str(days) if days > 0 else "1"
                 delivery_date_str = delivery_dt.strftime("%m/%d (%a)")
             except (ValueError, TypeError):
                 pass
 
-        raw_results.append(
-            {
-                "service_type": service_type,
-                "service_name": detail.get("serviceName", service_type),
-                "total_charge": total_charge,
-                "currency": currency,
-                "transit_days": transit_days,
-                "delivery_date": delivery_date_str,
-            }
-        )
-
-    # Deduplicate: keep cheapest per service_type
-    best_by_type = {}
-    for r in raw_results:
-        key = r["service_type"]
-        if key not in best_by_type or r["total_charge"] < best_by_type[key]["total_charge"]:
-            best_by_type[key] = r
+        best_by_type[service_type] = {
+            "service_type": service_type,
+            "service_name": detail.get("serviceName", service_type),
+            "total_charge": total_charge,
+            "currency": currency,
+            "transit_days": transit_days,
+            "delivery_date": delivery_date_str,
+        }
 
     # Sort by price ascending
-    return sorted(best_by_type.values(), key=lambda x: x["total_charge"])
+    return sorted(best_by_type.values(), key=itemgetter("total_charge"))
@@ -4,7 +4,9 @@ Google Sheets 連線模組
 """
 
 import os
+import threading
 import gspread
+import pandas as pd
 from google.oauth2.service_account import Credentials
 
 import config
@@ -16,6 +18,11 @@ SCOPES = [
 
 # Module-level cache for standalone (non-Streamlit) use
 _cached_client = None
+_client_lock = threading.Lock()
+
+# open_by_key 的結果，client 更換（cache 過期重新授權）時才重新開啟
+# (client, spreadsheet) 綁在同一個 tuple，一次賦值替換，避免其他執行緒讀到不一致的組合
+_spreadsheet_cache = {"entry": (None, None)}
 
 
 def _get_credentials() -> Credentials:
@@ -44,34 +51,47 @@ def _get_credentials() -> Credentials:
     )
 
 
+def _authorize() -> gspread.Client:
+    creds = _get_credentials()
+    return gspread.authorize(creds)
+
+
+# Streamlit cache（在 module 層級只建立一次，所有 session 共用同一個 client）
+try:
+    import streamlit as st
+
+    _st_cached_client = st.cache_resource(ttl=600)(_authorize)
+except ImportError:
+    _st_cached_client = None
+
+
 def get_gspread_client() -> gspread.Client:
     """取得 gspread client"""
     global _cached_client
 
     # 嘗試使用 Streamlit cache
-    try:
-        import streamlit as st
-
-        @st.cache_resource(ttl=600)
-        def _st_cached_client():
-            creds = _get_credentials()
-            return gspread.authorize(creds)
-
-        return _st_cached_client()
-    except Exception:
-        pass
+    if _st_cached_client is not None:
+        try:
+            return _st_cached_client()
+        except Exception:
+            pass
 
     # Fallback: module-level cache for standalone scripts
     if _cached_client is None:
-        creds = _get_credentials()
-        _cached_client = gspread.authorize(creds)
+        with _client_lock:
+            if _cached_client is None:
+                _cached_client = _authorize()
     return _cached_client
 
 
 def get_spreadsheet() -> gspread.Spreadsheet:
-    """取得主要的 Google Spreadsheet"""
+    """取得主要的 Google Spreadsheet（同一個 client 只開啟一次）"""
     client = get_gspread_client()
-    return client.open_by_key(config.GOOGLE_SHEETS_SPREADSHEET_ID)
+    cached_client, spreadsheet = _spreadsheet_cache["entry"]
+    if cached_client is not client:
+        spreadsheet = client.open_by_key(config.GOOGLE_SHEETS_SPREADSHEET_ID)
+        _spreadsheet_cache["entry"] = (client, spreadsheet)
+    return spreadsheet
 
 
 def get_or_create_worksheet(name: str, rows: int = 1000, cols: int = 20) -> gspread.Worksheet:
@@ -81,3 +101,23 @@ def get_or_create_worksheet(name: str, rows: int = 1000, cols: int = 20) -> gspr
         return spreadsheet.worksheet(name)
     except gspread.WorksheetNotFound:
         return spreadsheet.add_worksheet(title=name, rows=rows, cols=cols)
+
+
+def group_contiguous_rows(row_indices) -> list[tuple[int, int]]:
+    """將列號合併成連續區段，回傳 [(start, end), ...]（end 不含），用於批次格式化或刪除"""
+    runs = []
+    for idx in sorted(row_indices):
+        if runs and idx == runs[-1][1]:
+            runs[-1][1] = idx + 1
+        else:
+            runs.append([idx, idx + 1])
+    return [(start, end) for start, end in runs]
+
+
+def to_numeric_column(values: pd.Series) -> pd.Series:
+    """把 get_all_values 讀到的文字欄轉成數字，無法解析的為 NaN
+
+    get_all_values 回傳的是格式化後的文字，先去掉千分位逗號（同 gspread 的 numericise），
+    否則 "1,200" 會被當成無法解析
+    """
+    return pd.to_numeric(values.astype(str).str.replace(",", "", regex=False), errors="coerce")
@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+import streamlit as st
 from datetime import datetime, timedelta, timezone
 from io import BytesIO
 import config
@@ -58,70 +60,109 @@ def _get_history_worksheet():
     return ws
 
 
+# 同一張工作表的標題列只需確認一次，之後存檔不必再多讀一次第 1 列
+_header_checked_ids = set()
+
+
 def _ensure_header(ws):
-    """確保工作表有標題列"""
+    """確保工作表有標題列（依工作表 id 記錄已檢查過的，工作表被重建時會重新檢查）"""
+    if ws.id in _header_checked_ids:
+        return
     first_row = ws.row_values(1)
     if not first_row or first_row[0] != SHEET_HEADER[0]:
         ws.update([SHEET_HEADER], value_input_option="USER_ENTERED")
+    _header_checked_ids.add(ws.id)
 
 
-def _cleanup_old_records_sheet(ws):
-    """移除 Google Sheets 上超過 3 個月的紀錄"""
-    all_values = ws.get_all_values()
-    if len(all_values) <= 1:
-        return  # 只有標題或空表
-
-    cutoff = datetime.now(TZ_TAIPEI) - timedelta(days=90)
-    rows_to_delete = []
+def _cleanup_old_records_sheet(ws, all_values: list[list[str]]) -> list[list[str]]:
+    """移除 Google Sheets 上超過 3 個月的紀錄，回傳刪除後剩下的資料（含標題列）"""
+    from services.google_sheets import group_contiguous_rows
 
-    for i, row in enumerate(all_values[1:], start=2):  # 從第2列開始（跳過標題）
-        try:
-            ts = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S").replace(tzinfo=TZ_TAIPEI)
-            if ts < cutoff:
-                rows_to_delete.append(i)
-        except (ValueError, IndexError):
-            continue
+    if len(all_values) <= 1:
+        return all_values  # 只有標題或空表
+
+    # 時間戳記皆為台北時間 "%Y-%m-%d %H:%M:%S"，整欄一次解析；無法解析的列視為 NaT 保留
+    cutoff = (datetime.now(TZ_TAIPEI) - timedelta(days=90)).replace(tzinfo=None)
+    ts = pd.to_datetime(
+        [row[0] if row else "" for row in all_values[1:]],
+        format="%Y-%m-%d %H:%M:%S",
+        errors="coerce",
+    )
+    # all_values[1:] 的第 i 筆是工作表第 i+2 列，也就是 0-based 的第 i+1 列
+    is_expired = ts < cutoff
+    expired = (np.flatnonzero(is_expired) + 1).tolist()
+    if not expired:
+        return all_values
+
+    # 連續的過期列合併成一個 deleteDimension，一次 batch_update 刪完；
+    # 由下往上排列，避免前面的刪除讓後面的列號位移
+    requests = [
+        {
+            "deleteDimension": {
+                "range": {
+                    "sheetId": ws.id,
+                    "dimension": "ROWS",
+                    "startIndex": start,
+                    "endIndex": end,
+                }
+            }
+        }
+        for start, end in reversed(group_contiguous_rows(expired))
+    ]
+    ws.spreadsheet.batch_update({"requests": requests})
 
-    # 從最後一列開始刪（避免列號位移）
-    for row_idx in reversed(rows_to_delete):
-        ws.delete_rows(row_idx)
+    return [all_values[0]] + [row for row, old in zip(all_values[1:], is_expired) if not old]
 
 
 def save_quote(quote_data: dict):
     """儲存一筆報價紀錄到 Google Sheets"""
+    save_quotes_batch([quote_data])
+
+
+def save_quotes_batch(quotes: list[dict]):
+    """一次儲存多筆報價紀錄（同一時間戳記、單一 API 呼叫插入）"""
+    if not quotes:
+        return
     ws = _get_history_worksheet()
     _ensure_header(ws)
 
-    quote_data["timestamp"] = datetime.now(TZ_TAIPEI).strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = datetime.now(TZ_TAIPEI).strftime("%Y-%m-%d %H:%M:%S")
+    for quote_data in quotes:
+        quote_data["timestamp"] = timestamp
 
-    # 按 COLUMNS 順序組成一列，插入第 2 列（標題下方），最新紀錄在最上面
-    row = [str(quote_data.get(col, "")) for col in COLUMNS]
-    ws.insert_row(row, index=2, value_input_option="USER_ENTERED")
+    # 按 COLUMNS 順序組成列，整批插入第 2 列起（標題下方），最新紀錄在最上面
+    # 數值直接以原型別送出（JSON number），USER_ENTERED 下與字串結果相同，省去逐欄 str()
+    rows = [[quote_data.get(col, "") for col in COLUMNS] for quote_data in quotes]
+    ws.insert_rows(rows, row=2, value_input_option="USER_ENTERED")
 
+    # 讓歷史紀錄頁立即看到新紀錄，不必等快取過期
+    load_history.clear()
 
+
+@st.cache_data(ttl=300, show_spinner=False)
 def load_history() -> pd.DataFrame:
     """從 Google Sheets 載入歷史紀錄（自動清除超過 3 個月的資料）"""
     ws = _get_history_worksheet()
     _ensure_header(ws)
 
-    # 清除過期紀錄
-    _cleanup_old_records_sheet(ws)
+    # 讀取一次所有資料，清除過期紀錄後直接沿用剩下的列
+    all_values = _cleanup_old_records_sheet(ws, ws.get_all_values())
+    return _history_frame(all_values)
 
-    # 讀取所有資料
-    records = ws.get_all_records()
-    if not records:
-        return pd.DataFrame(columns=COLUMNS)
 
-    df = pd.DataFrame(records)
+def _history_frame(all_values: list[list[str]]) -> pd.DataFrame:
+    """把工作表的文字資料（含標題列）轉成歷史紀錄 DataFrame，數字欄轉為數值"""
+    from services.google_sheets import to_numeric_column
+
+    if len(all_values) <= 1:
+        return pd.DataFrame(columns=COLUMNS)
 
     # 將中文欄名對應回英文欄名
     reverse_labels = {v: k for k, v in COLUMN_LABELS.items()}
-    df = df.rename(columns=reverse_labels)
+    df = pd.DataFrame(all_values[1:], columns=[reverse_labels.get(h, h) for h in all_values[0]])
 
     # 確保所有必要欄位存在
-    for col in COLUMNS:
-        if col not in df.columns:
-            df[col] = ""
+    df = df.reindex(columns=COLUMNS, fill_value="")
 
     # 轉換數字欄位
     numeric_cols = [
@@ -129,16 +170,35 @@ def load_history() -> pd.DataFrame:
         "shipping_cost_ntd", "exchange_rate", "usd_cost",
         "markup_percent", "quoted_price_usd", "cost_per_kg_ntd",
     ]
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df[numeric_cols] = df[numeric_cols].apply(to_numeric_column)
 
-    return df[COLUMNS]
+    return df
 
 
+@st.cache_data(show_spinner=False, max_entries=32)
 def export_history_excel(df: pd.DataFrame) -> bytes:
-    """將 DataFrame 匯出為 Excel bytes"""
+    """將 DataFrame 匯出為 Excel bytes（依內容快取，篩選條件不變時 rerun 不重新產生）"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
     df_export = df.rename(columns=COLUMN_LABELS)
+    # NaN 寫成空白儲存格（與 DataFrame.to_excel 相同）
+    df_export = df_export.astype(object).where(df_export.notna(), None)
+
+    # write_only：逐列寫出，不在記憶體中建立整份工作表
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("運費報價紀錄")
+    bold = Font(bold=True)
+    header = []
+    for label in df_export.columns:
+        cell = WriteOnlyCell(ws, value=label)
+        cell.font = bold
+        header.append(cell)
+    ws.append(header)
+    for row in df_export.itertuples(index=False, name=None):
+        ws.append(row)
+
     output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df_export.to_excel(writer, index=False, sheet_name="運費報價紀錄")
+    wb.save(output)
     return output.getvalue()
@@ -1,48 +1,78 @@
-import json
-import math
+import os
 import re
+import numpy as np
+import orjson
+import pandas as pd
 import streamlit as st
 import config
 
+# 產品資料由 app 以 cache_resource 共用同一物件，依物件身分快取排序後的型號
+# (products, models) 綁在同一個 tuple，一次賦值替換，避免其他執行緒讀到不一致的組合
+_models_cache = {"entry": (None, ())}
+
+# 同步「原始檔案」時用的 regex：開頭數字、已有 -X 後綴
+_LEAD_DIGITS = re.compile(r"^(\d+)")
+_DASH_X = re.compile(r"-X\d+")
+
+# 本機 products.json 解析結果，檔案修改時間不變就直接沿用
+_json_cache = {"mtime_ns": None, "data": None}
+
 
 def _load_from_google_sheets() -> dict:
     """從 Google Sheets「產品資料」工作表讀取產品資料"""
-    from services.google_sheets import get_or_create_worksheet
+    from services.google_sheets import get_or_create_worksheet, to_numeric_column
 
     ws = get_or_create_worksheet(config.SHEET_NAME_PRODUCTS)
-    records = ws.get_all_records()
+    all_vals = ws.get_all_values()
+    if not all_vals:
+        return {}
 
-    products = {}
-    for row in records:
-        model = str(row.get("產品型號", "")).strip()
-        if not model:
-            continue
-        sets_per_carton = row.get("sets_per_carton", 0)
-        weight_kg = row.get("weight_kg", 0)
-        try:
-            sets_per_carton = int(sets_per_carton)
-            weight_kg = float(weight_kg)
-        except (ValueError, TypeError):
-            continue
+    # 依標題列找出欄位位置，之後逐列用索引取值
+    header = all_vals[0]
+    try:
+        i_model = header.index("產品型號")
+        i_sets = header.index("sets_per_carton")
+        i_weight = header.index("weight_kg")
+    except ValueError:
+        return {}
+
+    rows = all_vals[1:]
+    if not rows:
+        return {}
+
+    # 整欄一次轉數字（無法解析的為 NaN，千分位逗號先去掉），不再逐列 try/except
+    df = pd.DataFrame(rows).reindex(columns=[i_model, i_sets, i_weight])
+    models = df[i_model].fillna("").astype(str).str.strip()
+    sets_per_carton = to_numeric_column(df[i_sets])
+    weight_kg = to_numeric_column(df[i_weight]).astype(float)
+    valid = (models != "") & np.isfinite(sets_per_carton) & weight_kg.notna()
 
-        if model not in products:
-            products[model] = []
-        products[model].append({
-            "sets_per_carton": sets_per_carton,
-            "weight_kg": weight_kg,
+    products = {}
+    for model, sets, weight in zip(
+        models[valid].tolist(), sets_per_carton[valid].tolist(), weight_kg[valid].tolist()
+    ):
+        products.setdefault(model, []).append({
+            "sets_per_carton": int(sets),
+            "weight_kg": weight,
         })
 
     return products
 
 
 def _load_from_json() -> dict:
-    """從本機 products.json 讀取（備用）"""
-    with open(config.PRODUCTS_JSON, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """從本機 products.json 讀取（備用），檔案未變更時回傳上次解析的結果"""
+    mtime_ns = os.stat(config.PRODUCTS_JSON).st_mtime_ns
+    if _json_cache["mtime_ns"] != mtime_ns:
+        with open(config.PRODUCTS_JSON, "rb") as f:
+            _json_cache["data"] = orjson.loads(f.read())
+        _json_cache["mtime_ns"] = mtime_ns
+    return _json_cache["data"]
 
 
+# 產品資料為唯讀、所有 session 共用，用 cache_resource 直接回傳同一物件，避免每次 rerun 複製
+@st.cache_resource(ttl=600, show_spinner=False)
 def load_products() -> dict:
-    """載入產品資料（優先 Google Sheets，失敗時用本機 JSON）"""
+    """載入產品資料（優先 Google Sheets，失敗時用本機 JSON；快取 10 分鐘）"""
     try:
         products = _load_from_google_sheets()
         if products:
@@ -52,6 +82,44 @@ def load_products() -> dict:
     return _load_from_json()
 
 
+def _build_product_rows(source_rows: list[list[str]]) -> list[list]:
+    """把「原始檔案」的資料列整欄向量化轉成 [型號, sets_per_carton, weight_kg]，去重並排序"""
+    if not source_rows:
+        return []
+
+    # 只取 C..N 欄，不足的欄補空字串
+    df = pd.DataFrame(source_rows).reindex(columns=range(14)).fillna("")
+    col_c = df[2].astype(str).str.strip()   # 規格
+    col_d = df[3].astype(str).str.strip()   # 修正規格
+    col_g = df[6].astype(str).str.strip()   # 每盒顆數
+    col_i = df[8].astype(str).str.strip()   # 每箱盒數
+    col_n = df[13].astype(str).str.strip()  # 每箱毛重
+
+    # 如果 D 欄空，從 C + G 產生（C 已有 -X 後綴則直接用 C）
+    g_num = col_g.str.extract(_LEAD_DIGITS, expand=False)
+    generated = col_c.where(col_c.str.contains(_DASH_X), col_c + "-X" + g_num)
+    generated = generated.where((col_c != "") & g_num.notna(), "")
+    model = col_d.where(col_d != "", generated)
+
+    # 解析 sets_per_carton（開頭數字）與 weight
+    sets_per_carton = pd.to_numeric(col_i.str.extract(_LEAD_DIGITS, expand=False), errors="coerce")
+    weight = pd.to_numeric(col_n, errors="coerce")
+
+    valid = (model != "") & (sets_per_carton > 0) & (weight > 0)
+    out = pd.DataFrame({
+        "model": model[valid],
+        "sets": sets_per_carton[valid].astype(int),
+        "weight": weight[valid],
+    })
+    # 去重（同型號 + 同箱規保留第一筆）後排序
+    out = out.drop_duplicates(subset=["model", "sets"]).sort_values(["model", "sets"])
+
+    return [
+        [m, s, round(w, 2)]
+        for m, s, w in zip(out["model"].tolist(), out["sets"].tolist(), out["weight"].tolist())
+    ]
+
+
 def sync_products_from_source() -> int:
     """從「原始檔案」sheet 同步到「產品資料」sheet，回傳同步筆數"""
     from services.google_sheets import get_or_create_worksheet
@@ -60,70 +128,26 @@ def sync_products_from_source() -> int:
     dst_ws = get_or_create_worksheet(config.SHEET_NAME_PRODUCTS)
 
     all_vals = src_ws.get_all_values()
-
-    rows = []
-    seen = set()
-
-    for i in range(1, len(all_vals)):
-        row = all_vals[i]
-        col_c = row[2].strip() if len(row) > 2 else ""   # 規格
-        col_d = row[3].strip() if len(row) > 3 else ""   # 修正規格
-        col_g = row[6].strip() if len(row) > 6 else ""   # 每盒顆數
-        col_i = row[8].strip() if len(row) > 8 else ""   # 每箱盒數
-        col_n = row[13].strip() if len(row) > 13 else ""  # 每箱毛重
-
-        # 如果 D 欄空，從 C + G 產生
-        model = col_d
-        if not model and col_c and col_g:
-            g_match = re.match(r"(\d+)", col_g)
-            if g_match:
-                if re.search(r"-X\d+", col_c):
-                    model = col_c
-                else:
-                    model = f"{col_c}-X{g_match.group(1)}"
-
-        if not model:
-            continue
-
-        # 解析 sets_per_carton
-        s_match = re.match(r"(\d+)", col_i)
-        if not s_match:
-            continue
-        sets_per_carton = int(s_match.group(1))
-        if sets_per_carton <= 0:
-            continue
-
-        # 解析 weight
-        try:
-            weight = float(col_n)
-        except (ValueError, TypeError):
-            continue
-        if weight <= 0:
-            continue
-        weight = round(weight, 2)
-
-        # 去重
-        key = (model, sets_per_carton)
-        if key in seen:
-            continue
-        seen.add(key)
-
-        rows.append([model, sets_per_carton, weight])
-
-    # 排序
-    rows.sort(key=lambda r: (r[0], r[1]))
+    rows = _build_product_rows(all_vals[1:])
 
     # 寫入產品資料 sheet
     header = ["產品型號", "sets_per_carton", "weight_kg"]
     dst_ws.clear()
     dst_ws.update([header] + rows, value_input_option="USER_ENTERED")
 
+    # 下次載入直接讀取剛同步的資料
+    load_products.clear()
+
     return len(rows)
 
 
-def get_product_models(products: dict) -> list[str]:
-    """取得所有產品型號，排序"""
-    return sorted(products.keys())
+def get_product_models(products: dict) -> tuple[str, ...]:
+    """取得所有產品型號，排序（同一份產品資料只排序一次；回傳 tuple，呼叫端無法改動快取）"""
+    cached_products, models = _models_cache["entry"]
+    if cached_products is not products:
+        models = tuple(sorted(products))
+        _models_cache["entry"] = (products, models)
+    return models
 
 
 def get_packing_options(products: dict, model: str) -> list[dict]:
@@ -131,9 +155,96 @@ def get_packing_options(products: dict, model: str) -> list[dict]:
     return products.get(model, [])
 
 
+# DP 的時間與記憶體都和數量成正比（每組數一格）。數量在此以內用 DP；
+# 超過（遠大於實際訂單量）直接用 greedy，箱數可能比 DP 多，但不必建過大的表
+_DP_MAX_SETS = 10_000
+
+
+def _greedy_counts(opts_sorted: list[dict], quantity_sets: int) -> list[int]:
+    """先用最大箱裝滿，剩餘用最小箱裝；回傳與 opts_sorted 對應的箱數"""
+    counts = [0] * len(opts_sorted)
+    remaining = quantity_sets
+    smallest = None  # sets 最小的有效選項
+
+    for j, opt in enumerate(opts_sorted):
+        s = opt["sets_per_carton"]
+        if s <= 0:
+            continue
+        smallest = j
+        if remaining <= 0:
+            continue
+        count = remaining // s
+        counts[j] += count
+        remaining -= count * s
+
+    # 若仍有剩餘（沒有剛好整除的箱規），用最小箱裝
+    if remaining > 0 and smallest is not None:
+        counts[smallest] += -(-remaining // opts_sorted[smallest]["sets_per_carton"])  # 整數無條件進位
+
+    return counts
+
+
+def _optimal_counts(opts_sorted: list[dict], quantity_sets: int) -> list[int]:
+    """
+    DP 求裝得下 quantity_sets 的最少箱數，同箱數時取總重最輕；回傳與 opts_sorted 對應的箱數
+
+    運費依重量計，所以總重不得超過 greedy 的結果：比 greedy 重的組合不採用，
+    範圍內找不到時直接回傳 greedy。
+    只需考慮剛好裝 v 組、v 介於 quantity_sets 與 quantity_sets + 最大箱規 - 1 之間的組合
+    （再多一箱一定不是最佳），greedy 的結果也落在這個範圍內。
+    """
+    # 有效選項拆成平行 list：原索引、箱規、重量（以 0.01 kg 整數比較）
+    idx, sets, cents = [], [], []
+    for j, opt in enumerate(opts_sorted):
+        if opt["sets_per_carton"] > 0:
+            idx.append(j)
+            sets.append(opt["sets_per_carton"])
+            cents.append(round(opt["weight_kg"] * 100))
+    counts = [0] * len(opts_sorted)
+    if not idx:
+        return counts
+
+    top = quantity_sets + max(sets) - 1
+    inf = float("inf")
+    cartons = [0] + [inf] * top   # cartons[v]：剛好裝 v 組的最少箱數
+    weight = [0] * (top + 1)      # 對應的最輕總重（0.01 kg）
+    last = [-1] * (top + 1)       # 最後放入的選項，用於回推組合
+
+    # 選項依箱規由大到小，放得進 v 的是尾端一段；k 指向其開頭，隨 v 增加往前移
+    k = len(idx)
+    fits = []  # 放得進 v 的選項 (原索引, 箱規, 重量)，順序同 opts_sorted
+    for v in range(1, top + 1):
+        if k > 0 and sets[k - 1] <= v:
+            while k > 0 and sets[k - 1] <= v:
+                k -= 1
+            fits = list(zip(idx[k:], sets[k:], cents[k:]))
+        best_c, best_w, best_j = inf, 0, -1
+        for j, s, w in fits:
+            c = cartons[v - s] + 1
+            if c < best_c or (c == best_c and weight[v - s] + w < best_w):
+                best_c, best_w, best_j = c, weight[v - s] + w, j
+        cartons[v], weight[v], last[v] = best_c, best_w, best_j
+
+    greedy = _greedy_counts(opts_sorted, quantity_sets)
+    limit = sum(round(opt["weight_kg"] * 100) * c for opt, c in zip(opts_sorted, greedy))
+    candidates = [v for v in range(quantity_sets, top + 1) if weight[v] <= limit and cartons[v] < inf]
+    if not candidates:
+        return greedy
+    best_v = min(candidates, key=lambda v: (cartons[v], weight[v]))
+
+    v = best_v
+    while v > 0:
+        j = last[v]
+        counts[j] += 1
+        v -= opts_sorted[j]["sets_per_carton"]
+
+    return counts
+
+
 def calculate_shipment(options: list[dict], quantity_sets: int) -> dict:
     """
-    自動計算最佳裝箱方式：先用最大箱裝滿，剩餘用對應的小箱
+    自動計算最佳裝箱方式：箱數最少，同箱數時總重最輕，且總重不超過先大箱後小箱的 greedy
+    （數量過大時直接用 greedy）
 
     Args:
         options: [{"sets_per_carton": 1, "weight_kg": 3.95}, ...] 該型號所有包裝規格
@@ -149,40 +260,47 @@ def calculate_shipment(options: list[dict], quantity_sets: int) -> dict:
             ]
         }
     """
-    # 建立 sets → weight 對照表，依 sets 由大到小排序
+    # 大多數型號只有一種包裝：直接無條件進位，不必排序或 DP
+    if len(options) == 1 and options[0]["sets_per_carton"] > 0 and quantity_sets > 0:
+        opt = options[0]
+        count = -(-quantity_sets // opt["sets_per_carton"])
+        return {
+            "num_cartons": count,
+            "total_weight_kg": round(opt["weight_kg"] * count, 2),
+            "breakdown": [{
+                "sets_per_carton": opt["sets_per_carton"],
+                "weight_kg": opt["weight_kg"],
+                "count": count,
+            }],
+        }
+
+    # 依 sets 由大到小排序（breakdown 也依此順序）
     opts_sorted = sorted(options, key=lambda o: o["sets_per_carton"], reverse=True)
-    sets_to_weight = {o["sets_per_carton"]: o["weight_kg"] for o in opts_sorted}
 
-    remaining = quantity_sets
+    if quantity_sets <= 0:
+        counts = [0] * len(opts_sorted)
+    elif quantity_sets <= _DP_MAX_SETS:
+        counts = _optimal_counts(opts_sorted, quantity_sets)
+    else:
+        counts = _greedy_counts(opts_sorted, quantity_sets)
+
     breakdown = []  # [{sets_per_carton, weight_kg, count}]
+    num_cartons = 0
+    total_weight = 0
 
-    for opt in opts_sorted:
-        s = opt["sets_per_carton"]
-        if s <= 0 or remaining <= 0:
+    for opt, count in zip(opts_sorted, counts):
+        if count <= 0:
             continue
-        count = remaining // s
-        if count > 0:
-            breakdown.append({
-                "sets_per_carton": s,
-                "weight_kg": opt["weight_kg"],
-                "count": count,
-            })
-            remaining -= count * s
-
-    # 若仍有剩餘（沒有剛好整除的箱規），用最小箱裝
-    if remaining > 0 and opts_sorted:
-        smallest = opts_sorted[-1]  # sets 最小的選項
         breakdown.append({
-            "sets_per_carton": smallest["sets_per_carton"],
-            "weight_kg": smallest["weight_kg"],
-            "count": math.ceil(remaining / smallest["sets_per_carton"]),
+            "sets_per_carton": opt["sets_per_carton"],
+            "weight_kg": opt["weight_kg"],
+            "count": count,
         })
-
-    num_cartons = sum(b["count"] for b in breakdown)
-    total_weight = round(sum(b["weight_kg"] * b["count"] for b in breakdown), 2)
+        num_cartons += count
+        total_weight += opt["weight_kg"] * count
 
     return {
         "num_cartons": num_cartons,
-        "total_weight_kg": total_weight,
+        "total_weight_kg": round(total_weight, 2),
         "breakdown": breakdown,
     }
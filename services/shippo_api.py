@@ -1,9 +1,16 @@
+import orjson
 import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
 import config
 
 # Cache carrier account info (fetched once per session)
 _carrier_account_cache: dict | None = None
 
+# Shared session so repeated Shippo calls reuse keep-alive TLS connections
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+
 
 def _fetch_carrier_accounts(api_token: str | None = None) -> dict:
     """
@@ -27,9 +34,9 @@ def _fetch_carrier_accounts(api_token: str | None = None) -> dict:
     accounts = {}
     try:
         while url:
-            resp = requests.get(url, headers=headers, timeout=30)
+            resp = _session.get(url, headers=headers, timeout=30)
             resp.raise_for_status()
-            data = resp.json()
+            data = orjson.loads(resp.content)
             for acct in data.get("results", []):
                 obj_id = acct.get("object_id", "")
                 carrier = acct.get("carrier", "").upper()
@@ -57,6 +64,7 @@ def get_carrier_account_names(api_token: str | None = None) -> dict[str, str]:
     return {k: v["name"] for k, v in accounts.items() if v["active"]}
 
 
+@st.cache_data(ttl=900, show_spinner=False)
 def get_domestic_rates(
     sender: dict,
     recipient_zip: str,
@@ -74,7 +82,8 @@ def get_domestic_rates(
         api_token: Shippo API token (defaults to config value)
 
     Returns:
-        Shippo API raw response dict
+        Shippo API raw response dict (identical queries within 15 minutes
+        return the cached response instead of calling Shippo again)
     """
     token = api_token or config.SHIPPO_API_TOKEN
     if not token:
@@ -102,9 +111,9 @@ def get_domestic_rates(
         "async": False,
     }
 
-    response = requests.post(url, json=payload, headers=headers, timeout=60)
+    response = _session.post(url, json=payload, headers=headers, timeout=60)
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
 
 
 def parse_shippo_rates(response_json: dict) -> list[dict]:
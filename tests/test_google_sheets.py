@@ -0,0 +1,17 @@
+from services.google_sheets import group_contiguous_rows
+
+
+def test_groups_contiguous_rows_into_half_open_ranges():
+    assert group_contiguous_rows([1, 2, 3, 5, 7, 8]) == [(1, 4), (5, 6), (7, 9)]
+
+
+def test_sorts_unordered_rows_before_grouping():
+    assert group_contiguous_rows([8, 2, 7, 1]) == [(1, 3), (7, 9)]
+
+
+def test_single_row_is_one_range():
+    assert group_contiguous_rows([4]) == [(4, 5)]
+
+
+def test_no_rows_gives_no_ranges():
+    assert group_contiguous_rows([]) == []
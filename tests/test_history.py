@@ -0,0 +1,103 @@
+import math
+from datetime import datetime, timedelta
+
+from services.history import COLUMN_LABELS, COLUMNS, TZ_TAIPEI, _cleanup_old_records_sheet, _history_frame
+
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.batch_updates = []
+
+    def batch_update(self, body):
+        self.batch_updates.append(body)
+
+
+class FakeWorksheet:
+    """只記錄 batch_update 內容的工作表替身"""
+
+    id = 42
+
+    def __init__(self):
+        self.spreadsheet = FakeSpreadsheet()
+
+
+HEADER = ["日期時間", "運送類型"]
+
+
+def _stamp(days_ago: int) -> str:
+    return (datetime.now(TZ_TAIPEI) - timedelta(days=days_ago)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _deleted_ranges(ws):
+    (body,) = ws.spreadsheet.batch_updates
+    ranges = [r["deleteDimension"]["range"] for r in body["requests"]]
+    assert all(r["sheetId"] == ws.id and r["dimension"] == "ROWS" for r in ranges)
+    return [(r["startIndex"], r["endIndex"]) for r in ranges]
+
+
+def test_deletes_expired_runs_bottom_up_with_zero_based_indices():
+    # 工作表第 2 列起：新、舊、舊、新、舊 → 0-based 第 2..3 列、第 5 列過期
+    rows = [
+        [_stamp(1), "a"],
+        [_stamp(100), "b"],
+        [_stamp(120), "c"],
+        [_stamp(10), "d"],
+        [_stamp(200), "e"],
+    ]
+    ws = FakeWorksheet()
+
+    remaining = _cleanup_old_records_sheet(ws, [HEADER] + rows)
+
+    assert _deleted_ranges(ws) == [(5, 6), (2, 4)]
+    assert remaining == [HEADER, rows[0], rows[3]]
+
+
+def test_keeps_rows_with_unparseable_timestamps():
+    rows = [["", "a"], ["not a date", "b"], [_stamp(95), "c"], [], [_stamp(1), "d"]]
+    ws = FakeWorksheet()
+
+    remaining = _cleanup_old_records_sheet(ws, [HEADER] + rows)
+
+    assert _deleted_ranges(ws) == [(3, 4)]
+    assert remaining == [HEADER, rows[0], rows[1], rows[3], rows[4]]
+
+
+def test_nothing_expired_makes_no_api_call():
+    all_values = [HEADER, [_stamp(1), "a"], [_stamp(89), "b"]]
+    ws = FakeWorksheet()
+
+    assert _cleanup_old_records_sheet(ws, all_values) is all_values
+    assert ws.spreadsheet.batch_updates == []
+
+
+def test_header_only_sheet_is_returned_unchanged():
+    ws = FakeWorksheet()
+
+    assert _cleanup_old_records_sheet(ws, [HEADER]) == [HEADER]
+    assert _cleanup_old_records_sheet(ws, []) == []
+    assert ws.spreadsheet.batch_updates == []
+
+
+def test_history_frame_reads_thousands_separated_numbers():
+    header = [COLUMN_LABELS["timestamp"], COLUMN_LABELS["shipping_cost_ntd"], COLUMN_LABELS["usd_cost"]]
+    df = _history_frame([header, ["2026-10-01 10:00:00", "12,345", "2,000.1"], ["2026-10-02 10:00:00", "1200", ""]])
+
+    assert df["shipping_cost_ntd"].tolist() == [12345, 1200]
+    assert df["usd_cost"].iloc[0] == 2000.1
+    assert math.isnan(df["usd_cost"].iloc[1])
+
+
+def test_history_frame_fills_missing_columns_and_keeps_text_as_nan():
+    header = [COLUMN_LABELS["timestamp"], COLUMN_LABELS["exchange_rate"]]
+    df = _history_frame([header, ["2026-10-01 10:00:00", "n/a"]])
+
+    assert list(df.columns) == COLUMNS
+    assert math.isnan(df["exchange_rate"].iloc[0])
+    assert df["product_model"].iloc[0] == ""
+
+
+def test_history_frame_header_only_gives_empty_frame():
+    df = _history_frame([[COLUMN_LABELS["timestamp"]]])
+
+    assert df.empty
+    assert list(df.columns) == COLUMNS
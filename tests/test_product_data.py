@@ -0,0 +1,274 @@
+import itertools
+import random
+import re
+
+import pytest
+
+import services.google_sheets
+from services.product_data import (
+    _DP_MAX_SETS,
+    _build_product_rows,
+    _greedy_counts,
+    _load_from_google_sheets,
+    calculate_shipment,
+)
+
+# ADA HANDLE 的實際包裝規格：1 組一箱最輕，大箱反而比較重
+ADA_HANDLE = [
+    {"sets_per_carton": 1, "weight_kg": 0.85},
+    {"sets_per_carton": 3, "weight_kg": 3.0},
+    {"sets_per_carton": 5, "weight_kg": 4.9},
+    {"sets_per_carton": 5, "weight_kg": 4.7},
+    {"sets_per_carton": 9, "weight_kg": 8.3},
+    {"sets_per_carton": 10, "weight_kg": 9.3},
+    {"sets_per_carton": 12, "weight_kg": 11.2},
+]
+
+# 典型規格：大箱每組比較輕
+TYPICAL = [
+    {"sets_per_carton": 1, "weight_kg": 3.95},
+    {"sets_per_carton": 2, "weight_kg": 7.74},
+    {"sets_per_carton": 4, "weight_kg": 15.3},
+]
+
+# 箱規不互相整除，greedy 會多用一箱
+ODD_SIZES = [
+    {"sets_per_carton": 3, "weight_kg": 3.0},
+    {"sets_per_carton": 5, "weight_kg": 5.0},
+]
+
+
+def _greedy_totals(options, quantity_sets):
+    opts_sorted = sorted(options, key=lambda o: o["sets_per_carton"], reverse=True)
+    counts = _greedy_counts(opts_sorted, quantity_sets)
+    weight = sum(opt["weight_kg"] * c for opt, c in zip(opts_sorted, counts))
+    return sum(counts), round(weight, 2)
+
+
+def _packed_sets(result):
+    return sum(b["sets_per_carton"] * b["count"] for b in result["breakdown"])
+
+
+@pytest.mark.parametrize("options", [ADA_HANDLE, TYPICAL, ODD_SIZES])
+@pytest.mark.parametrize("quantity_sets", range(1, 61))
+def test_never_heavier_or_more_cartons_than_greedy(options, quantity_sets):
+    result = calculate_shipment(options, quantity_sets)
+    greedy_cartons, greedy_weight = _greedy_totals(options, quantity_sets)
+
+    assert _packed_sets(result) >= quantity_sets
+    assert result["total_weight_kg"] <= greedy_weight
+    assert result["num_cartons"] <= greedy_cartons
+
+
+def test_keeps_light_single_set_cartons_when_a_bigger_carton_is_heavier():
+    result = calculate_shipment(ADA_HANDLE, 2)
+
+    assert result["num_cartons"] == 2
+    assert result["total_weight_kg"] == 1.7
+    assert result["breakdown"] == [{"sets_per_carton": 1, "weight_kg": 0.85, "count": 2}]
+
+
+def test_uses_fewer_cartons_than_greedy_when_two_middle_cartons_fit():
+    options = [
+        {"sets_per_carton": 1, "weight_kg": 1.0},
+        {"sets_per_carton": 4, "weight_kg": 3.9},
+        {"sets_per_carton": 6, "weight_kg": 5.9},
+    ]
+    # greedy：6 + 1 + 1 = 3 箱 7.9 kg；DP：4 + 4 = 2 箱 7.8 kg
+    result = calculate_shipment(options, 8)
+
+    assert result["num_cartons"] == 2
+    assert result["total_weight_kg"] == 7.8
+    assert result["breakdown"] == [{"sets_per_carton": 4, "weight_kg": 3.9, "count": 2}]
+
+
+def test_picks_a_lighter_mix_than_greedy_at_the_same_carton_count():
+    # greedy：5 + 5，剩 1 組再補一箱 3 = 3 箱 13 kg；DP：5 + 3 + 3 同樣 3 箱但只有 11 kg
+    result = calculate_shipment(ODD_SIZES, 11)
+
+    assert result["num_cartons"] == 3
+    assert result["total_weight_kg"] == 11.0
+    assert _packed_sets(result) == 11
+
+
+def test_matches_brute_force_best_under_the_greedy_weight():
+    options = ODD_SIZES + [{"sets_per_carton": 7, "weight_kg": 6.5}]
+    for quantity_sets in range(1, 30):
+        greedy_cartons, greedy_weight = _greedy_totals(options, quantity_sets)
+        best = None
+        for counts in itertools.product(range(11), repeat=len(options)):
+            packed = sum(o["sets_per_carton"] * c for o, c in zip(options, counts))
+            weight = round(sum(o["weight_kg"] * c for o, c in zip(options, counts)), 2)
+            if packed >= quantity_sets and weight <= greedy_weight:
+                key = (sum(counts), weight)
+                best = key if best is None or key < best else best
+
+        result = calculate_shipment(options, quantity_sets)
+        assert (result["num_cartons"], result["total_weight_kg"]) == best
+
+
+def test_single_option_rounds_up():
+    result = calculate_shipment([{"sets_per_carton": 4, "weight_kg": 15.3}], 9)
+
+    assert result["num_cartons"] == 3
+    assert result["total_weight_kg"] == 45.9
+
+
+@pytest.mark.parametrize("quantity_sets", [0, -3])
+def test_non_positive_quantity_ships_nothing(quantity_sets):
+    result = calculate_shipment(TYPICAL, quantity_sets)
+
+    assert result == {"num_cartons": 0, "total_weight_kg": 0, "breakdown": []}
+
+
+def test_empty_options_ship_nothing():
+    assert calculate_shipment([], 5) == {"num_cartons": 0, "total_weight_kg": 0, "breakdown": []}
+
+
+def test_falls_back_to_greedy_above_the_dp_limit():
+    quantity_sets = _DP_MAX_SETS + 1
+    result = calculate_shipment(ODD_SIZES, quantity_sets)
+
+    assert (result["num_cartons"], result["total_weight_kg"]) == _greedy_totals(ODD_SIZES, quantity_sets)
+
+
+def _loop_build_product_rows(source_rows):
+    """原本逐列處理「原始檔案」的寫法，作為 _build_product_rows 的對照"""
+    rows = []
+    seen = set()
+    for row in source_rows:
+        col_c = row[2].strip() if len(row) > 2 else ""
+        col_d = row[3].strip() if len(row) > 3 else ""
+        col_g = row[6].strip() if len(row) > 6 else ""
+        col_i = row[8].strip() if len(row) > 8 else ""
+        col_n = row[13].strip() if len(row) > 13 else ""
+
+        model = col_d
+        if not model and col_c and col_g:
+            g_match = re.match(r"(\d+)", col_g)
+            if g_match:
+                if re.search(r"-X\d+", col_c):
+                    model = col_c
+                else:
+                    model = f"{col_c}-X{g_match.group(1)}"
+        if not model:
+            continue
+
+        s_match = re.match(r"(\d+)", col_i)
+        if not s_match:
+            continue
+        sets_per_carton = int(s_match.group(1))
+        if sets_per_carton <= 0:
+            continue
+
+        try:
+            weight = float(col_n)
+        except (ValueError, TypeError):
+            continue
+        if weight <= 0:
+            continue
+        weight = round(weight, 2)
+
+        key = (model, sets_per_carton)
+        if key in seen:
+            continue
+        seen.add(key)
+        rows.append([model, sets_per_carton, weight])
+
+    rows.sort(key=lambda r: (r[0], r[1]))
+    return rows
+
+
+def _random_source_row(rng):
+    pick = rng.choice
+    row = [""] * 14
+    row[2] = pick(["", "K51M-450", "K51M-450-X3", " K51P-500 ", "ADA HANDLE", "W41M"])
+    row[3] = pick(["", "", "", "K51M-400-X3", " W41M-X2 "])
+    row[6] = pick(["", "3", "2顆", "12 pcs", "x", "0"])
+    row[8] = pick(["", "1", "2", "4盒", "10 boxes", "0", "-1", "abc", " 6 "])
+    row[13] = pick(["", "3.95", "7.741", "15.3", "0", "-2", "1e1", " 8.25 ", "abc", "1,200", "0.004"])
+    # 模擬工作表中長短不一的列
+    return row[:pick([3, 4, 7, 9, 13, 14, 14, 14])]
+
+
+def test_build_product_rows_matches_the_row_loop_on_random_rows():
+    rng = random.Random(20261015)
+    for _ in range(200):
+        source_rows = [_random_source_row(rng) for _ in range(rng.randint(0, 40))]
+        assert _build_product_rows(source_rows) == _loop_build_product_rows(source_rows)
+
+
+def test_build_product_rows_generates_model_from_spec_and_piece_count():
+    row = ["", "", "K51M-450", "", "", "", "3顆", "", "2盒", "", "", "", "", "6.2"]
+    assert _build_product_rows([row]) == [["K51M-450-X3", 2, 6.2]]
+
+
+def test_build_product_rows_keeps_first_duplicate_and_sorts():
+    rows = [
+        ["", "", "", "B-X1", "", "", "", "", "2", "", "", "", "", "5"],
+        ["", "", "", "A-X1", "", "", "", "", "4", "", "", "", "", "9"],
+        ["", "", "", "B-X1", "", "", "", "", "2", "", "", "", "", "6"],
+        ["", "", "", "A-X1", "", "", "", "", "1", "", "", "", "", "2.345"],
+    ]
+    assert _build_product_rows(rows) == [["A-X1", 1, 2.35], ["A-X1", 4, 9.0], ["B-X1", 2, 5.0]]
+
+
+def test_build_product_rows_drops_nan_weight():
+    # 原本的 float() 會接受 "nan" 並寫出 NaN 重量；向量化版本視為無效列
+    row = ["", "", "", "A-X1", "", "", "", "", "2", "", "", "", "", "nan"]
+    assert _build_product_rows([row]) == []
+
+
+def test_build_product_rows_empty_input():
+    assert _build_product_rows([]) == []
+
+
+class _StubWorksheet:
+    def __init__(self, values):
+        self.values = values
+
+    def get_all_values(self):
+        return self.values
+
+
+@pytest.fixture
+def products_sheet(monkeypatch):
+    """讓 _load_from_google_sheets 讀取指定內容的替身工作表"""
+    def use(values):
+        monkeypatch.setattr(services.google_sheets, "get_or_create_worksheet", lambda name: _StubWorksheet(values))
+    return use
+
+
+def test_sheet_products_accept_thousands_separators(products_sheet):
+    products_sheet([
+        ["產品型號", "sets_per_carton", "weight_kg"],
+        ["BULK-X1", "1,200", "1,234.5"],
+        ["K51M-450-X3", "2", "6.2"],
+    ])
+
+    assert _load_from_google_sheets() == {
+        "BULK-X1": [{"sets_per_carton": 1200, "weight_kg": 1234.5}],
+        "K51M-450-X3": [{"sets_per_carton": 2, "weight_kg": 6.2}],
+    }
+
+
+def test_sheet_products_skip_blank_models_and_unparseable_numbers(products_sheet):
+    products_sheet([
+        ["weight_kg", "產品型號", "sets_per_carton"],
+        ["3.0", "  ", "1"],
+        ["abc", "A-X1", "1"],
+        ["3.0", "A-X1", ""],
+        ["3.0", " A-X1 ", "2"],
+        ["4.5", "A-X1", "3"],
+    ])
+
+    assert _load_from_google_sheets() == {
+        "A-X1": [{"sets_per_carton": 2, "weight_kg": 3.0}, {"sets_per_carton": 3, "weight_kg": 4.5}],
+    }
+
+
+@pytest.mark.parametrize("values", [[], [["產品型號", "sets_per_carton", "weight_kg"]], [["型號", "箱規", "重量"], ["A", "1", "2"]]])
+def test_sheet_products_empty_or_missing_columns(products_sheet, values):
+    products_sheet(values)
+
+    assert _load_from_google_sheets() == {}
@@ -0,0 +1,104 @@
+from types import MappingProxyType
+
+import pytest
+
+from views.quote import _parse_prefill_products, _parse_us_address
+
+
+def _addr(zip_code="", state="", city="", street=""):
+    return {"zip": zip_code, "state": state, "city": city, "street": street}
+
+
+@pytest.mark.parametrize("text, expected", [
+    # 街名裡像州代碼的字（Mt → MT、In → IN、Ca → CA）不可搶走 ZIP 前的州代碼
+    ("1 Mt Hood Rd, Portland, OR 97201", _addr("97201", "OR", "Portland", "1 Mt Hood Rd")),
+    ("123 In Street, Indianapolis, IN 46204", _addr("46204", "IN", "Indianapolis", "123 In Street")),
+    ("55 Ca Ave, Sacramento CA 95814", _addr("95814", "CA", "Sacramento", "55 Ca Ave")),
+])
+def test_state_before_zip_wins_over_street_words(text, expected):
+    assert dict(_parse_us_address(text)) == expected
+
+
+def test_zip_plus_four_keeps_five_digit_zip():
+    assert dict(_parse_us_address("1234 Main St, Los Angeles, CA 90001-1234")) == _addr(
+        "90001", "CA", "Los Angeles", "1234 Main St"
+    )
+
+
+def test_without_zip_takes_the_last_state_code():
+    assert dict(_parse_us_address("1 Mt Hood Rd, Springfield, IL")) == _addr(
+        "", "IL", "Springfield", "1 Mt Hood Rd"
+    )
+
+
+def test_leading_us_route_is_read_as_a_country_name():
+    # 與原本的解析相同："US" 一律當國名移除
+    assert dict(_parse_us_address("US Route 1, Kennebunk, ME 04043")) == _addr(
+        "04043", "ME", "Kennebunk", "Route 1"
+    )
+
+
+@pytest.mark.parametrize("text", [
+    "1234 Main St, Austin, TX 78701, USA",
+    "1234 Main St, Austin, TX 78701, United States",
+    "1234 Main St. Austin TX 78701 U.S.A.",
+    "1234 Main St\nAustin, TX 78701\nus",
+])
+def test_country_suffixes_are_dropped(text):
+    assert dict(_parse_us_address(text)) == _addr("78701", "TX", "Austin", "1234 Main St")
+
+
+@pytest.mark.parametrize("text", ["", "   ", "\n"])
+def test_empty_input_gives_blank_fields(text):
+    assert dict(_parse_us_address(text)) == _addr()
+
+
+def test_result_is_read_only():
+    # 結果有 lru_cache 共用，呼叫端不能改動
+    result = _parse_us_address("Austin, TX 78701")
+
+    assert isinstance(result, MappingProxyType)
+    with pytest.raises(TypeError):
+        result["zip"] = "00000"
+
+
+@pytest.mark.parametrize("quantity_sets, expected", [
+    ("3", 3),
+    ("3.0", 3),
+    (10.0, 10),
+    ("1e3", 1000),
+    ("abc", 1),
+    ("", 1),
+    ("inf", 1),
+])
+def test_prefill_quantity_accepts_any_number_else_one(quantity_sets, expected):
+    assert _parse_prefill_products({"model": "A", "quantity_sets": quantity_sets}) == [("A", expected)]
+
+
+def test_prefill_splits_on_semicolons_with_spaces():
+    prefill = {"model": " A ; B ", "quantity_sets": " 4 ; 5 "}
+
+    assert _parse_prefill_products(prefill) == [("A", 4), ("B", 5)]
+
+
+def test_prefill_non_numeric_token_defaults_to_one():
+    prefill = {"model": "A; B; C", "quantity_sets": "2; x; 3"}
+
+    assert _parse_prefill_products(prefill) == [("A", 2), ("B", 1), ("C", 3)]
+
+
+def test_prefill_pads_missing_quantities_with_one():
+    prefill = {"model": "A; B; C", "quantity_sets": "7"}
+
+    assert _parse_prefill_products(prefill) == [("A", 7), ("B", 1), ("C", 1)]
+
+
+def test_prefill_ignores_extra_quantities():
+    prefill = {"model": "A", "quantity_sets": "2; 3; 4"}
+
+    assert _parse_prefill_products(prefill) == [("A", 2)]
+
+
+def test_prefill_without_models_is_empty():
+    assert _parse_prefill_products({"model": " ; ", "quantity_sets": "2"}) == []
+    assert _parse_prefill_products({}) == []
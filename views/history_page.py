@@ -1,8 +1,15 @@
+import numpy as np
 import streamlit as st
 import pandas as pd
 from services.history import load_history, export_history_excel, COLUMN_LABELS
 
 
+def _filter_options(series: pd.Series) -> list[str]:
+    """Sorted unique non-empty values of *series* for a filter multiselect."""
+    values = series.dropna().astype(str).to_numpy()
+    return np.unique(values[values != ""]).tolist()
+
+
 def render_history_page():
     st.header("歷史報價紀錄 Quote History")
     st.caption("自動保留 3 個月內的紀錄 Auto-retains records from the last 3 months")
@@ -16,18 +23,22 @@ def render_history_page():
     # ── Filters ──
     col1, col2 = st.columns(2)
     with col1:
-        model_options = sorted(s for s in df["product_model"].dropna().astype(str).unique() if s)
+        model_options = _filter_options(df["product_model"])
         model_filter = st.multiselect("篩選產品型號 Filter by Model", model_options)
     with col2:
-        state_options = sorted(s for s in df["destination_state"].dropna().astype(str).unique() if s)
+        state_options = _filter_options(df["destination_state"])
         state_filter = st.multiselect("篩選州別 Filter by State", state_options)
 
-    # Apply filters
-    filtered = df.copy()
-    if model_filter:
-        filtered = filtered[filtered["product_model"].isin(model_filter)]
-    if state_filter:
-        filtered = filtered[filtered["destination_state"].isin(state_filter)]
+    # Apply filters (no filter selected: use df as-is, no masking pass)
+    if model_filter or state_filter:
+        mask = np.ones(len(df), dtype=bool)
+        if model_filter:
+            mask &= df["product_model"].isin(model_filter).to_numpy()
+        if state_filter:
+            mask &= df["destination_state"].isin(state_filter).to_numpy()
+        filtered = df[mask]
+    else:
+        filtered = df
 
     # ── Display ──
     if filtered.empty:
@@ -37,28 +48,29 @@ def render_history_page():
     # 顯示每筆紀錄，附帶「編輯」按鈕
     st.subheader(f"共 {len(filtered)} 筆紀錄 {len(filtered)} Record(s)")
 
-    for idx, row in filtered.iterrows():
+    # itertuples：每列是 namedtuple，不必像 iterrows 逐列建立 Series
+    for row in filtered.itertuples():
         with st.container(border=True):
             c1, c2, c3, c4 = st.columns([2, 2, 2, 1])
-            c1.markdown(f"**{row['product_model']}** — {row.get('packing_config', '')}")
-            c2.markdown(f"{row.get('quantity_sets', '')} sets → {row.get('destination_state', '')} {row.get('destination_zip', '')}")
-            c3.markdown(f"**US$ {row.get('quoted_price_usd', 0):,.2f}** ({row.get('service_name', '')})")
+            c1.markdown(f"**{row.product_model}** — {row.packing_config}")
+            c2.markdown(f"{row.quantity_sets} sets → {row.destination_state} {row.destination_zip}")
+            c3.markdown(f"**US$ {row.quoted_price_usd:,.2f}** ({row.service_name})")
 
             with c4:
-                if st.button("編輯 Edit", key=f"edit_{idx}"):
+                if st.button("編輯 Edit", key=f"edit_{row.Index}"):
                     st.session_state["prefill"] = {
-                        "model": str(row.get("product_model", "")),
-                        "packing_config": str(row.get("packing_config", "")),
-                        "quantity_sets": str(row.get("quantity_sets", "1")),
-                        "dest_zip": str(row.get("destination_zip", "")),
-                        "dest_state": str(row.get("destination_state", "")),
-                        "exchange_rate": float(row.get("exchange_rate", 30)) if pd.notna(row.get("exchange_rate")) else 30.0,
-                        "markup_percent": float(row.get("markup_percent", 15)) if pd.notna(row.get("markup_percent")) else 15.0,
+                        "model": str(row.product_model),
+                        "packing_config": str(row.packing_config),
+                        "quantity_sets": str(row.quantity_sets),
+                        "dest_zip": str(row.destination_zip),
+                        "dest_state": str(row.destination_state),
+                        "exchange_rate": float(row.exchange_rate) if pd.notna(row.exchange_rate) else 30.0,
+                        "markup_percent": float(row.markup_percent) if pd.notna(row.markup_percent) else 15.0,
                     }
                     st.session_state["nav_page"] = "運費報價 Quote"
                     st.rerun()
 
-            st.caption(f"{row.get('timestamp', '')} | {row.get('service_type', '')} | NT$ {row.get('shipping_cost_ntd', 0):,.0f} | 匯率 Rate {row.get('exchange_rate', '')} | 加成 Markup {row.get('markup_percent', '')}%")
+            st.caption(f"{row.timestamp} | {row.service_type} | NT$ {row.shipping_cost_ntd:,.0f} | 匯率 Rate {row.exchange_rate} | 加成 Markup {row.markup_percent}%")
 
     # ── Summary 統計摘要 ──
     st.divider()
@@ -66,10 +78,10 @@ def render_history_page():
     col1, col2, col3 = st.columns(3)
     col1.metric("紀錄筆數 Records", len(filtered))
     if "cost_per_kg_ntd" in filtered.columns:
-        avg_cost = filtered["cost_per_kg_ntd"].astype(float).mean()
+        avg_cost = filtered["cost_per_kg_ntd"].mean()
         col2.metric("平均每KG成本 Avg Cost/KG", f"NT$ {avg_cost:,.2f}")
     if "quoted_price_usd" in filtered.columns:
-        avg_quote = filtered["quoted_price_usd"].astype(float).mean()
+        avg_quote = filtered["quoted_price_usd"].mean()
         col3.metric("平均報價金額 Avg Quote", f"US$ {avg_quote:,.2f}")
 
     # ── Download 下載 ──
@@ -1,25 +1,74 @@
 import re
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import chain, repeat
+from html import escape
+from types import MappingProxyType
+import numpy as np
 import streamlit as st
 from services.product_data import (
     get_product_models,
     get_packing_options,
     calculate_shipment,
 )
-from services.fedex_api import get_rate_quote, parse_rate_response
-from services.shippo_api import get_domestic_rates, parse_shippo_rates
-from services.history import save_quote
 import config
 
 PRODUCT_DATA_URL = "https://docs.google.com/spreadsheets/d/1Bkbj1Iyi-CsSRCEABGlRmxJuvANmQuh41_4uVnHHoo0/edit?gid=214800878#gid=214800878"
 WEIGHT_DATA_URL = "https://docs.google.com/spreadsheets/d/1Bkbj1Iyi-CsSRCEABGlRmxJuvANmQuh41_4uVnHHoo0/edit?gid=510415783#gid=510415783"
 
 
-US_STATES = {
+US_STATES = frozenset({
     "AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "FL", "GA",
     "HI", "ID", "IL", "IN", "IA", "KS", "KY", "LA", "ME", "MD",
     "MA", "MI", "MN", "MS", "MO", "MT", "NE", "NV", "NH", "NJ",
     "NM", "NY", "NC", "ND", "OH", "OK", "OR", "PA", "RI", "SC",
     "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY", "DC",
+})
+
+# Address parsing patterns (compiled once)
+# Country name, ZIP (5 digits, optional +4) or a US state code, found in one left-to-right scan
+_ADDR_RE = re.compile(
+    r"\b(?:(?P<country>(?i:United\s+States|USA|U\.S\.A\.?|US))"
+    r"|(?P<zip>\d{5})(?:-\d{4})?"
+    r"|(?P<state>(?i:" + "|".join(sorted(US_STATES)) + r")))\b"
+)
+_PUNCT_TABLE = str.maketrans(".\n", ",,")  # "." and newlines split fields like ","
+
+# Prefill lists from history records: "A; B" models and "2; 3" quantities
+_SEMI_RE = re.compile(r"\s*;\s*")
+
+# Rate-card styles (injected once per results section): figure grid rows and service badges
+_RATE_CARD_CSS = """<style>
+.rate-metrics{display:grid;gap:0.25rem 1rem;margin-bottom:0.75rem;}
+.rate-metric-label{font-size:0.875rem;opacity:0.6;}
+.rate-metric-value{font-size:1.75rem;line-height:1.3;}
+.rate-badge{color:white;padding:2px 8px;border-radius:4px;font-size:0.85em;}
+.rate-badge-express{background:#FF6B35;}
+.rate-badge-priority{background:#2196F3;}
+</style>"""
+# Service headings for the rate cards (markdown; name is the FedEx service name)
+_BADGE_PRIORITY_EXPRESS_TMPL = '**{name}**　<span class="rate-badge rate-badge-express">業務報價專用</span>'
+_BADGE_PRIORITY_TMPL = '**{name}**　<span class="rate-badge rate-badge-priority">一般正式出貨使用</span>'
+
+
+def _metric_grid(items: list[tuple[str, str]]) -> str:
+    """HTML for a row of label/value figures styled like st.metric (one grid column per item)."""
+    cells = "".join(
+        f'<div><div class="rate-metric-label">{escape(label)}</div>'
+        f'<div class="rate-metric-value">{escape(str(value))}</div></div>'
+        for label, value in items
+    )
+    return f'<div class="rate-metrics" style="grid-template-columns:repeat({len(items)},1fr);">{cells}</div>'
+
+
+# FedEx international service display order and classification
+_PRIORITY_EXPRESS_TYPE = "FEDEX_INTERNATIONAL_PRIORITY_EXPRESS"
+_PRIORITY_TYPES = frozenset({"INTERNATIONAL_PRIORITY", "FEDEX_INTERNATIONAL_PRIORITY"})
+_ECONOMY_TYPES = frozenset({"INTERNATIONAL_ECONOMY", "FEDEX_INTERNATIONAL_ECONOMY"})
+_SERVICE_ORDER = {
+    _PRIORITY_EXPRESS_TYPE: 0,
+    **dict.fromkeys(_PRIORITY_TYPES, 1),
+    **dict.fromkeys(_ECONOMY_TYPES, 2),
 }
 
 MAX_PRODUCTS = 5
@@ -29,6 +78,57 @@ QUICK_MODELS = [
     "K51M-400-X3", "K51M-450-X3", "K51M-450-X2",
     "K51P-500-X2", "K51M-500D-X3", "K51MP-450-X2", "K51MP-450-X3",
 ]
+_QUICK_MODELS_SET = frozenset(QUICK_MODELS)
+
+# Selectbox model order, rebuilt only when the catalog's model list changes.
+# (all_models, models, index) is swapped in as one tuple so a concurrent session never sees a mixed entry.
+_ordered_models_cache = {"entry": (None, [], {})}
+
+
+def _ordered_models(products: dict) -> tuple[list[str], dict[str, int]]:
+    """Return QUICK_MODELS first, followed by the rest of the catalog, plus a model -> position map."""
+    all_models = get_product_models(products)
+    cached_all, models, index = _ordered_models_cache["entry"]
+    if cached_all is not all_models:
+        models = QUICK_MODELS + [
+            m for m in all_models if m not in _QUICK_MODELS_SET
+        ]
+        index = {m: i for i, m in enumerate(models)}
+        _ordered_models_cache["entry"] = (all_models, models, index)
+    return models, index
+
+
+def _quick_models(products: dict, keep) -> list[str]:
+    """QUICK_MODELS plus any catalog model in *keep* (prefilled / already selected), in catalog order."""
+    _, model_index = _ordered_models(products)
+    extra = sorted(
+        (m for m in keep if m in model_index and m not in _QUICK_MODELS_SET),
+        key=model_index.__getitem__,
+    )
+    return QUICK_MODELS + extra if extra else QUICK_MODELS
+
+
+# Packing results and row captions per (model, qty), valid for one products catalog.
+# (products, shipments) is swapped in as one tuple, like _ordered_models_cache.
+_shipment_cache = {"entry": (None, {})}
+_SHIPMENT_CACHE_MAX = 1024
+
+
+def _shipment_for(products: dict, model: str, qty: int) -> tuple[dict, str] | None:
+    """(calculate_shipment result, row caption) for a product row, memoized; None when the model has no packing data."""
+    cached_products, shipments = _shipment_cache["entry"]
+    if cached_products is not products or len(shipments) >= _SHIPMENT_CACHE_MAX:
+        shipments = {}
+        _shipment_cache["entry"] = (products, shipments)
+    key = (model, qty)
+    if key not in shipments:
+        options = get_packing_options(products, model)
+        if options:
+            shipment = calculate_shipment(options, qty)
+            shipments[key] = (shipment, f"　{model}: " + _breakdown_text(shipment["breakdown"])[0])
+        else:
+            shipments[key] = None
+    return shipments[key]
 
 
 def _find_source_pfx(exclude_pfx: str) -> str | None:
@@ -78,27 +178,48 @@ def _clear_all_inputs():
         del st.session_state[k]
 
 
-def _parse_us_address(text: str) -> dict:
-    """Parse a US address, return {zip, state, city, street}"""
+@lru_cache(maxsize=256)
+def _parse_us_address(text: str) -> MappingProxyType:
+    """Parse a US address, return read-only {zip, state, city, street} (memoized per text)"""
     result = {"zip": "", "state": "", "city": "", "street": ""}
     text = text.strip()
     if not text:
-        return result
-
-    text = re.sub(r"\b(United\s+States|USA|U\.S\.A\.?|US)\b", "", text, flags=re.IGNORECASE)
-
-    zip_match = re.search(r"\b(\d{5})(?:-\d{4})?\b", text)
-    if zip_match:
-        result["zip"] = zip_match.group(1)
-        text = text[:zip_match.start()] + text[zip_match.end():]
-
-    for token in re.findall(r"\b([A-Za-z]{2})\b", text):
-        if token.upper() in US_STATES:
-            result["state"] = token.upper()
-            text = re.sub(r"\b" + re.escape(token) + r"\b", "", text, count=1)
-            break
-
-    text = re.sub(r"[,.\n]+", ",", text)
+        return MappingProxyType(result)
+
+    # Drop country names, the first ZIP and the state code; keep everything else.
+    # The state is the last code before the ZIP ("City, ST 12345"), else the last one in the text,
+    # so street words like "Mt" (MT) or "in" (IN) earlier in the address don't win.
+    cut = []
+    zip_start = None
+    state_m = state_before_zip = None
+    for m in _ADDR_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == "country":
+            cut.append(m.span())
+        elif kind == "zip":
+            if zip_start is None:
+                zip_start = m.start()
+                result["zip"] = m.group("zip")
+                cut.append(m.span())
+        else:
+            state_m = m
+            if zip_start is None:
+                state_before_zip = m
+
+    state_m = state_before_zip or state_m
+    if state_m:
+        result["state"] = state_m.group("state").upper()
+        cut.append(state_m.span())
+        cut.sort()
+
+    pieces, pos = [], 0
+    for start, end in cut:
+        pieces.append(text[pos:start])
+        pos = end
+    pieces.append(text[pos:])
+    text = "".join(pieces)
+
+    text = text.translate(_PUNCT_TABLE)
     parts = [p.strip() for p in text.split(",") if p.strip()]
 
     if len(parts) >= 2:
@@ -107,39 +228,62 @@ def _parse_us_address(text: str) -> dict:
     elif len(parts) == 1:
         result["city"] = parts[0]
 
-    return result
+    return MappingProxyType(result)
+
+
+def _prefill_qty(text: str) -> int:
+    """One prefill quantity: any number the sheet may hold ("3", "3.0", "1e3"), else 1."""
+    try:
+        return int(float(text))
+    except (ValueError, OverflowError):
+        return 1
 
 
 def _parse_prefill_products(prefill: dict) -> list:
     """Parse semicolon-separated multi-product prefill data, return [(model, qty), ...]"""
-    models = [m.strip() for m in str(prefill.get("model", "")).split(";") if m.strip()]
-    quantities_raw = str(prefill.get("quantity_sets", "1")).split(";")
-    quantities = []
-    for q in quantities_raw:
-        try:
-            quantities.append(int(float(q.strip())))
-        except ValueError:
-            quantities.append(1)
-    while len(quantities) < len(models):
-        quantities.append(1)
-    return list(zip(models, quantities))
-
-
-def _clear_old_results_if_changed(product_entries, dest_zip, dest_state, state_key):
-    """Clear old results when input conditions change"""
+    models = [m for m in _SEMI_RE.split(str(prefill.get("model", "")).strip()) if m]
+    quantities = map(_prefill_qty, _SEMI_RE.split(str(prefill.get("quantity_sets", "1")).strip()))
+    # Models without a matching quantity default to 1; extra quantities are ignored
+    return list(zip(models, chain(quantities, repeat(1))))
+
+
+def _load_prefill(prefill_key: str) -> tuple[dict | None, list]:
+    """Pop a history prefill for one tab; return (prefill, [(model, qty), ...]) and show the notice."""
+    prefill = st.session_state.pop(prefill_key, None)
+    if not prefill:
+        return None, []
+    st.info("已從歷史紀錄帶入資料，請修改後重新查詢。\nData loaded from history. Please modify and re-query.")
+    return prefill, _parse_prefill_products(prefill)
+
+
+def _query_key(product_entries, dest_zip, dest_state) -> int:
+    """Hash of the inputs a rate query depends on (stored with the query, compared on every rerun)."""
+    return hash((tuple((e["model"], e["quantity_sets"]) for e in product_entries), dest_zip, dest_state))
+
+
+def _clear_old_results_if_changed(query_key, state_key):
+    """Clear old results when input conditions (see _query_key) change"""
     if state_key not in st.session_state:
         return
-    q = st.session_state[state_key]
-    current_key = [(e["model"], e["quantity_sets"]) for e in product_entries]
-    saved_key = q.get("products_key", [])
-    rates_key = state_key.replace("last_query", "last_rates")
-    if (
-        current_key != saved_key
-        or q["dest_zip"] != dest_zip
-        or q["dest_state"] != dest_state
-    ):
-        st.session_state.pop(rates_key, None)
+    if st.session_state[state_key].get("query_key") != query_key:
+        st.session_state.pop(state_key.replace("last_query", "last_rates"), None)
         st.session_state.pop(state_key, None)
+        st.session_state.pop(state_key.replace("last_query", "rate_calc"), None)
+        st.session_state.pop(state_key.replace("last_query", "sorted_rates"), None)
+        st.session_state.pop(state_key.replace("last_query", "save_pick"), None)
+
+
+# Domestic fixed-cost tiers as parallel lists sorted by max sets, for bisect lookups
+_FIXED_TIERS = sorted(config.DOMESTIC_FIXED_COSTS)
+_FIXED_MAX_SETS = [max_sets for max_sets, _ in _FIXED_TIERS]
+_FIXED_COSTS = [cost for _, cost in _FIXED_TIERS]
+
+# Domestic sender radio: "name (zip)" label -> warehouse address, plus the custom-ZIP choice
+_SENDER_BY_LABEL = {
+    f"{name} ({info['zip']})": info for name, info in config.DOMESTIC_SENDERS.items()
+}
+_CUSTOM_SENDER_LABEL = "Custom ZIP 自訂"
+_SENDER_LABELS = [*_SENDER_BY_LABEL, _CUSTOM_SENDER_LABEL]
 
 
 def _get_fixed_basic_cost(total_sets: int) -> tuple[float | None, bool]:
@@ -147,63 +291,78 @@ def _get_fixed_basic_cost(total_sets: int) -> tuple[float | None, bool]:
     Return (fixed_cost, needs_manual_input) based on total sets.
     If total_sets > 25, returns (None, True).
     """
-    for max_sets, cost in config.DOMESTIC_FIXED_COSTS:
-        if total_sets <= max_sets:
-            return cost, False
+    i = bisect_left(_FIXED_MAX_SETS, total_sets)
+    if i < len(_FIXED_COSTS):
+        return _FIXED_COSTS[i], False
     return None, True
 
 
 def _build_shippo_parcels(total_cartons: int, total_weight_kg: float) -> list[dict]:
-    """Build Shippo parcel list from carton count and total weight."""
+    """Build Shippo parcel list from carton count and total weight.
+    Cartons are identical, so every entry is the same (read-only) dict.
+    """
     weight_per_parcel = round(total_weight_kg / total_cartons, 2) if total_cartons > 0 else 0
-    parcels = []
-    for _ in range(total_cartons):
-        parcels.append({
-            "length": str(config.DEFAULT_CARTON_LENGTH_CM),
-            "width": str(config.DEFAULT_CARTON_WIDTH_CM),
-            "height": str(config.DEFAULT_CARTON_HEIGHT_CM),
-            "distance_unit": "cm",
-            "weight": str(weight_per_parcel),
-            "mass_unit": "kg",
-        })
-    return parcels
+    parcel = {
+        "length": str(config.DEFAULT_CARTON_LENGTH_CM),
+        "width": str(config.DEFAULT_CARTON_WIDTH_CM),
+        "height": str(config.DEFAULT_CARTON_HEIGHT_CM),
+        "distance_unit": "cm",
+        "weight": str(weight_per_parcel),
+        "mass_unit": "kg",
+    }
+    return [parcel] * total_cartons
+
+
+@lru_cache(maxsize=256)
+def _breakdown_text_cached(breakdown: tuple) -> tuple[str, str]:
+    caption = " + ".join(f"{c} 箱 x {s}sets ({w}kg)" for c, s, w in breakdown)
+    desc = " + ".join(f"{c}x{s}sets" for c, s, _ in breakdown)
+    return caption, desc
+
+
+def _breakdown_text(breakdown: list[dict]) -> tuple[str, str]:
+    """Return (caption, packing description) for a shipment breakdown, memoized per breakdown."""
+    return _breakdown_text_cached(
+        tuple((b["count"], b["sets_per_carton"], b["weight_kg"]) for b in breakdown)
+    )
 
 
 def _render_product_section(products, prefill, prefill_products, pfx):
     """Render the shared product & quantity section.
     pfx: key prefix for unique widget keys ('intl' or 'dom').
-    Returns (product_entries, total_cartons, total_weight_kg, total_sets) or None.
+    Returns (product_entries, total_cartons, total_weight_kg, total_sets, extra_weight) or None.
     """
-    col_header, col_link1, col_link2 = st.columns([3, 1, 1])
+    col_header, col_link1, col_link2 = st.columns([3, 1, 1], vertical_alignment="bottom")
     with col_header:
         st.subheader("1. 產品 & 數量 Product & Quantity")
     with col_link1:
-        st.markdown(
-            f'<a href="{PRODUCT_DATA_URL}" target="_blank">'
-            f'<button style="margin-top:18px;padding:4px 12px;border:1px solid #ccc;border-radius:4px;background:#f0f2f6;cursor:pointer;">'
-            f'重量明細編輯 Edit Weight Data</button></a>',
-            unsafe_allow_html=True,
-        )
+        st.link_button("重量明細編輯 Edit Weight Data", PRODUCT_DATA_URL)
     with col_link2:
-        st.markdown(
-            f'<a href="{WEIGHT_DATA_URL}" target="_blank">'
-            f'<button style="margin-top:18px;padding:4px 12px;border:1px solid #ccc;border-radius:4px;background:#f0f2f6;cursor:pointer;">'
-            f'報價紀錄 Quote Log</button></a>',
-            unsafe_allow_html=True,
-        )
-
-    all_models = get_product_models(products)
-    other_models = [m for m in all_models if m not in QUICK_MODELS]
-    models = QUICK_MODELS + other_models
+        st.link_button("報價紀錄 Quote Log", WEIGHT_DATA_URL)
 
     rows_key = f"{pfx}_num_product_rows"
     if prefill_products:
         st.session_state[rows_key] = len(prefill_products)
+        # Seed the row widgets through their keys (not index=/value=) so a prefill always
+        # wins over whatever the rows held before, without a reset on the next rerun.
+        _, all_index = _ordered_models(products)
+        for i, (pf_model, pf_qty) in enumerate(prefill_products):
+            st.session_state[f"{pfx}_product_{i}_model"] = pf_model if pf_model in all_index else None
+            st.session_state[f"{pfx}_product_{i}_qty"] = pf_qty
     elif rows_key not in st.session_state:
         st.session_state[rows_key] = 1
 
     num_rows = st.session_state[rows_key]
 
+    # The dropdowns list only the quick models by default; prefilled and already-selected
+    # models are kept so toggling the full catalog off never drops a selection.
+    if st.toggle("顯示全部型號 Show all models", key=f"{pfx}_show_all_models"):
+        models, _ = _ordered_models(products)
+    else:
+        keep = {m for m, _ in prefill_products}
+        keep.update(st.session_state.get(f"{pfx}_product_{i}_model") for i in range(num_rows))
+        models = _quick_models(products, keep)
+
     btn_col1, btn_col2, _ = st.columns([1, 1, 3])
     with btn_col1:
         if num_rows < MAX_PRODUCTS:
@@ -221,22 +380,19 @@ def _render_product_section(products, prefill, prefill_products, pfx):
 
     product_entries = []
     has_missing_data = False
+    total_cartons = 0
+    total_weight_kg = 0.0
+    total_sets = 0
 
+    # Rows are live widgets (no form), so the query/save buttons below always see the values
+    # on screen; _shipment_for memoizes packing, which keeps the per-edit rerun cheap.
     for i in range(num_rows):
-        prefill_model_idx = None
-        prefill_qty = 1
-        if i < len(prefill_products):
-            pf_model, pf_qty = prefill_products[i]
-            if pf_model in models:
-                prefill_model_idx = models.index(pf_model)
-            prefill_qty = pf_qty
-
         col_model, col_qty = st.columns([3, 1])
         with col_model:
             model_i = st.selectbox(
                 f"產品 {i+1} Product {i+1}",
                 models,
-                index=prefill_model_idx,
+                index=None,
                 placeholder="請選擇 Select",
                 key=f"{pfx}_product_{i}_model",
             )
@@ -244,7 +400,6 @@ def _render_product_section(products, prefill, prefill_products, pfx):
             qty_i = st.number_input(
                 f"數量 Qty {i+1} (sets)",
                 min_value=1,
-                value=prefill_qty,
                 step=1,
                 key=f"{pfx}_product_{i}_qty",
             )
@@ -253,25 +408,33 @@ def _render_product_section(products, prefill, prefill_products, pfx):
             has_missing_data = True
             continue
 
-        options_i = get_packing_options(products, model_i)
-        if not options_i:
+        row = _shipment_for(products, model_i, qty_i)
+        if row is None:
             st.warning(f"產品 {i+1} ({model_i}) 無包裝資料 No packing data")
             has_missing_data = True
             continue
+        shipment_i, caption_i = row
 
-        shipment_i = calculate_shipment(options_i, qty_i)
         product_entries.append({
             "model": model_i,
             "quantity_sets": qty_i,
             "shipment": shipment_i,
         })
+        total_cartons += shipment_i["num_cartons"]
+        total_weight_kg += shipment_i["total_weight_kg"]
+        total_sets += qty_i
 
-        breakdown_parts = []
-        for b in shipment_i["breakdown"]:
-            breakdown_parts.append(
-                f"{b['count']} 箱 x {b['sets_per_carton']}sets ({b['weight_kg']}kg)"
-            )
-        st.caption(f"　{model_i}: " + " + ".join(breakdown_parts))
+        st.caption(caption_i)
+
+    # Default seeded through session state so a value synced from another tab isn't overridden
+    st.session_state.setdefault(f"{pfx}_extra_weight", 0.5)
+    extra_weight = st.number_input(
+        "額外重量 Extra Weight (kg)",
+        min_value=0.0,
+        step=0.1,
+        format="%.1f",
+        key=f"{pfx}_extra_weight",
+    )
 
     if not product_entries:
         st.info("請選擇至少一個產品型號 Please select at least one product model")
@@ -280,15 +443,13 @@ def _render_product_section(products, prefill, prefill_products, pfx):
     if has_missing_data:
         return None
 
-    total_cartons = sum(e["shipment"]["num_cartons"] for e in product_entries)
-    total_weight_kg = round(sum(e["shipment"]["total_weight_kg"] for e in product_entries), 2)
-    total_sets = sum(e["quantity_sets"] for e in product_entries)
+    total_weight_kg = round(total_weight_kg, 2)
 
     col_a, col_b = st.columns(2)
     col_a.metric("總箱數 Total Cartons", f"{total_cartons} 箱 ctns")
     col_b.metric("產品重量 Product Weight", f"{total_weight_kg} kg")
 
-    return product_entries, total_cartons, total_weight_kg, total_sets
+    return product_entries, total_cartons, total_weight_kg, total_sets, extra_weight
 
 
 def _render_destination_section(prefill, pfx):
@@ -352,32 +513,61 @@ def _render_destination_section(prefill, pfx):
     return dest_zip, dest_state, dest_city, dest_street
 
 
-def _save_quote_common(query, rate_data, shipping_type):
-    """Build and save a quote record for both international and domestic."""
-    entries = query["product_entries"]
-    product_model_str = "; ".join(e["model"] for e in entries)
-    quantity_sets_str = "; ".join(str(e["quantity_sets"]) for e in entries)
-    packing_parts = []
-    for e in entries:
-        per_product = " + ".join(
-            f"{b['count']}x{b['sets_per_carton']}sets"
-            for b in e["shipment"]["breakdown"]
+def _query_base_record(query: dict) -> dict:
+    """Fields shared by every rate saved from one query, built once and kept on the query."""
+    base = query.get("base_record")
+    if base is None:
+        entries = query["product_entries"]
+        packing_desc = "; ".join(
+            f"{e['model']}: {_breakdown_text(e['shipment']['breakdown'])[1]}" for e in entries
         )
-        packing_parts.append(f"{e['model']}: {per_product}")
-    packing_desc = "; ".join(packing_parts)
-
-    record = {
-        "shipping_type": shipping_type,
-        "product_model": product_model_str,
-        "packing_config": packing_desc,
-        "quantity_sets": quantity_sets_str,
-        "num_cartons": query["combined_shipment"]["num_cartons"],
-        "total_weight_kg": query["combined_shipment"]["total_weight_kg"],
-        "destination_state": query["dest_state"],
-        "destination_zip": query["dest_zip"],
-    }
+        base = query["base_record"] = {
+            "product_model": "; ".join(e["model"] for e in entries),
+            "packing_config": packing_desc,
+            "quantity_sets": "; ".join(str(e["quantity_sets"]) for e in entries),
+            "num_cartons": query["combined_shipment"]["num_cartons"],
+            "total_weight_kg": query["combined_shipment"]["total_weight_kg"],
+            "destination_state": query["dest_state"],
+            "destination_zip": query["dest_zip"],
+        }
+    return base
+
+
+def _quote_record(query, rate_data, shipping_type) -> dict:
+    """Full history record for one rate of *query*."""
+    record = {**_query_base_record(query), "shipping_type": shipping_type}
     record.update(rate_data)
-    save_quote(record)
+    return record
+
+
+def _save_quote_common(query, rate_data, shipping_type):
+    """Build and save a quote record for both international and domestic."""
+    # Imported on first save so rendering the quote page doesn't load the history module
+    from services.history import save_quote
+
+    save_quote(_quote_record(query, rate_data, shipping_type))
+
+
+def _render_save_selected(query, save_options, shipping_type, pfx):
+    """One picker + Save button for all rate cards; the picked rates go in one history insert.
+    save_options: [(label, rate_data), ...] in card order.
+    """
+    picked = st.multiselect(
+        "選擇要儲存的報價 Rates to save",
+        range(len(save_options)),
+        format_func=lambda i: save_options[i][0],
+        placeholder="請選擇 Select",
+        key=f"{pfx}_save_pick",
+    )
+    if st.button(
+        f"儲存選擇的報價 Save Selected ({len(picked)})",
+        key=f"{pfx}_save_selected",
+        disabled=not picked,
+    ):
+        from services.history import save_quotes_batch
+
+        save_quotes_batch([_quote_record(query, save_options[i][1], shipping_type) for i in picked])
+        st.success(f"已儲存 {len(picked)} 筆報價! {len(picked)} quotes saved!")
 
 
 # ---------------------------------------------------------------------------
@@ -415,26 +605,13 @@ def render_quote_page(products: dict):
 def _render_international_flow(products: dict):
     pfx = "intl"
 
-    prefill = st.session_state.pop("prefill", None)
-    prefill_products = []
-    if prefill:
-        st.info("已從歷史紀錄帶入資料，請修改後重新查詢。\nData loaded from history. Please modify and re-query.")
-        prefill_products = _parse_prefill_products(prefill)
+    prefill, prefill_products = _load_prefill("prefill")
 
     # ── 1. Product & Quantity ──
     product_result = _render_product_section(products, prefill, prefill_products, pfx)
     if product_result is None:
         return
-    product_entries, total_cartons, total_weight_kg, total_sets = product_result
-
-    extra_weight = st.number_input(
-        "額外重量 Extra Weight (kg)",
-        min_value=0.0,
-        value=0.5,
-        step=0.1,
-        format="%.1f",
-        key=f"{pfx}_extra_weight",
-    )
+    product_entries, total_cartons, total_weight_kg, total_sets, extra_weight = product_result
 
     combined_weight = total_weight_kg + extra_weight
     st.metric("合計重量 Combined Weight", f"{combined_weight:.1f} kg")
@@ -472,7 +649,8 @@ def _render_international_flow(products: dict):
     st.divider()
 
     # ── Clear stale results ──
-    _clear_old_results_if_changed(product_entries, dest_zip, dest_state, f"{pfx}_last_query")
+    query_key = _query_key(product_entries, dest_zip, dest_state)
+    _clear_old_results_if_changed(query_key, f"{pfx}_last_query")
 
     # ── Query Button ──
     account_number = st.session_state.get("fedex_account", "")
@@ -485,12 +663,15 @@ def _render_international_flow(products: dict):
             st.error("請輸入 ZIP Code 或完整地址\nPlease enter a ZIP Code or full address")
             return
 
-        destination = {
-            "postal_code": dest_zip,
-            "state_code": dest_state.upper() if dest_state else "",
-            "city": dest_city,
-            "street": dest_street,
-        }
+        # Imported on first query so other pages/tabs don't load the FedEx client
+        from services.fedex_api import Destination, get_rate_quote, parse_rate_response
+
+        destination = Destination(
+            postal_code=dest_zip,
+            state_code=dest_state.upper() if dest_state else "",
+            city=dest_city,
+            street=dest_street,
+        )
 
         combined_shipment = {
             "num_cartons": total_cartons,
@@ -512,15 +693,18 @@ def _render_international_flow(products: dict):
                     return
 
                 st.session_state[f"{pfx}_last_rates"] = rates
+                st.session_state.pop(f"{pfx}_save_pick", None)
                 st.session_state[f"{pfx}_last_query"] = {
                     "shipping_type": "international",
                     "product_entries": product_entries,
-                    "products_key": [(e["model"], e["quantity_sets"]) for e in product_entries],
+                    "query_key": query_key,
                     "combined_shipment": combined_shipment,
                     "dest_state": dest_state,
                     "dest_zip": dest_zip,
                     "exchange_rate": exchange_rate,
                     "markup_percent": markup_percent,
+                    # NT$ charges in rates order, so reruns only redo the division/markup
+                    "costs_ntd": np.fromiter((r["total_charge"] for r in rates), dtype=np.float64, count=len(rates)),
                 }
 
             except Exception as e:
@@ -535,69 +719,110 @@ def _render_international_flow(products: dict):
                 return
 
     # ── 4. Results ──
+    _render_intl_results(pfx, exchange_rate, markup_percent)
+
+
+@st.fragment
+def _render_intl_results(pfx, exchange_rate, markup_percent):
+    """International rate cards. A fragment, so Save/Select clicks rerun only this block."""
     if f"{pfx}_last_rates" in st.session_state and f"{pfx}_last_query" in st.session_state:
         st.subheader("4. 運費結果 Rate Results")
+        st.markdown(_RATE_CARD_CSS, unsafe_allow_html=True)
 
         query = st.session_state[f"{pfx}_last_query"]
         rates = st.session_state[f"{pfx}_last_rates"]
         current_exchange = exchange_rate
         current_markup = markup_percent
 
-        SERVICE_ORDER = {
-            "FEDEX_INTERNATIONAL_PRIORITY_EXPRESS": 0,
-            "INTERNATIONAL_PRIORITY": 1,
-            "FEDEX_INTERNATIONAL_PRIORITY": 1,
-            "INTERNATIONAL_ECONOMY": 2,
-            "FEDEX_INTERNATIONAL_ECONOMY": 2,
-        }
-        sorted_rates = sorted(
-            rates,
-            key=lambda r: SERVICE_ORDER.get(r["service_type"], 99),
-        )
-
-        cost_by_type = {}
-        for rate in sorted_rates:
-            cost_by_type[rate["service_type"]] = rate["total_charge"]
-
-        priority_cost = cost_by_type.get(
-            "FEDEX_INTERNATIONAL_PRIORITY",
-            cost_by_type.get("INTERNATIONAL_PRIORITY"),
-        )
-        economy_cost = cost_by_type.get(
-            "FEDEX_INTERNATIONAL_ECONOMY",
-            cost_by_type.get("INTERNATIONAL_ECONOMY"),
-        )
+        # Ordering, per-rate service flags and the Priority/Economy costs depend only on the
+        # fetched rates; work them out once per fetch
+        sorted_cache = st.session_state.get(f"{pfx}_sorted_rates")
+        if sorted_cache is None or sorted_cache["rates"] is not rates:
+            order = sorted(
+                range(len(rates)),
+                key=lambda j: _SERVICE_ORDER.get(rates[j]["service_type"], 99),
+            )
+            sorted_rates = [rates[j] for j in order]
+
+            cost_by_type = {}
+            for rate in sorted_rates:
+                cost_by_type[rate["service_type"]] = rate["total_charge"]
+
+            sorted_cache = {
+                "rates": rates,
+                "order": order,
+                "sorted": sorted_rates,
+                # (is_priority_express, is_priority, is_economy) per sorted rate
+                "flags": [
+                    (
+                        r["service_type"] == _PRIORITY_EXPRESS_TYPE,
+                        r["service_type"] in _PRIORITY_TYPES,
+                        r["service_type"] in _ECONOMY_TYPES,
+                    )
+                    for r in sorted_rates
+                ],
+                "priority_cost": cost_by_type.get(
+                    "FEDEX_INTERNATIONAL_PRIORITY",
+                    cost_by_type.get("INTERNATIONAL_PRIORITY"),
+                ),
+                "economy_cost": cost_by_type.get(
+                    "FEDEX_INTERNATIONAL_ECONOMY",
+                    cost_by_type.get("INTERNATIONAL_ECONOMY"),
+                ),
+            }
+            st.session_state[f"{pfx}_sorted_rates"] = sorted_cache
+        order = sorted_cache["order"]
+        sorted_rates = sorted_cache["sorted"]
+        priority_cost = sorted_cache["priority_cost"]
+        economy_cost = sorted_cache["economy_cost"]
 
         combined_weight = query["combined_shipment"]["total_weight_kg"]
 
-        for i, rate in enumerate(sorted_rates):
+        # Derive every card's figures in one vectorized pass; the loop below only lays out widgets.
+        # Reruns that don't touch the rates, exchange rate or markup reuse the stored figures.
+        calc_key = (current_exchange, current_markup, combined_weight)
+        calc = st.session_state.get(f"{pfx}_rate_calc")
+        if calc is None or calc["rates"] is not rates or calc["key"] != calc_key:
+            charges = query["costs_ntd"][order]
+            usd_costs = charges / current_exchange if current_exchange > 0 else np.zeros_like(charges)
+            quoted_usds = usd_costs * (1 + current_markup / 100)
+            costs_per_kg = charges / combined_weight if combined_weight > 0 else np.zeros_like(charges)
+            figures = list(zip(usd_costs.tolist(), quoted_usds.tolist(), costs_per_kg.tolist()))
+            calc = {
+                "rates": rates,
+                "key": calc_key,
+                "figures": figures,
+                # Card HTML only changes with the figures, so it is built here rather than per rerun
+                "cards": [
+                    _metric_grid([
+                        ("運費成本 Shipping Cost", f"NT$ {rate['total_charge']:,.0f}"),
+                        ("美金成本 USD Cost", f"US$ {usd_cost:,.2f}"),
+                        (f"報價金額 Quote (+{current_markup:.0f}%)", f"US$ {quoted_usd:,.2f}"),
+                    ])
+                    + _metric_grid([
+                        ("每KG成本 Cost/KG", f"NT$ {cost_per_kg:,.2f}"),
+                        ("預計天數 Transit Days", rate["transit_days"]),
+                    ])
+                    for rate, (usd_cost, quoted_usd, cost_per_kg) in zip(sorted_rates, figures)
+                ],
+            }
+            st.session_state[f"{pfx}_rate_calc"] = calc
+
+        save_options = []  # (picker label, rate_data) per card, saved via _render_save_selected
+        for rate, (is_priority_express, is_priority, is_economy), (usd_cost, quoted_usd, cost_per_kg), card_html in zip(
+            sorted_rates, sorted_cache["flags"], calc["figures"], calc["cards"]
+        ):
             cost_ntd = rate["total_charge"]
-            usd_cost = cost_ntd / current_exchange if current_exchange > 0 else 0
-            quoted_usd = usd_cost * (1 + current_markup / 100)
-            cost_per_kg = (
-                cost_ntd / combined_weight
-                if combined_weight > 0
-                else 0
-            )
-
-            stype = rate["service_type"]
-            is_priority_express = stype == "FEDEX_INTERNATIONAL_PRIORITY_EXPRESS"
-            is_priority = stype in ("INTERNATIONAL_PRIORITY", "FEDEX_INTERNATIONAL_PRIORITY")
-            is_economy = stype in ("INTERNATIONAL_ECONOMY", "FEDEX_INTERNATIONAL_ECONOMY")
 
             with st.container(border=True):
                 if is_priority_express:
                     st.markdown(
-                        f"**{rate['service_name']}**　"
-                        f'<span style="background:#FF6B35;color:white;padding:2px 8px;border-radius:4px;font-size:0.85em;">'
-                        f'業務報價專用</span>',
+                        _BADGE_PRIORITY_EXPRESS_TMPL.format(name=rate["service_name"]),
                         unsafe_allow_html=True,
                     )
                 elif is_priority:
                     st.markdown(
-                        f"**{rate['service_name']}**　"
-                        f'<span style="background:#2196F3;color:white;padding:2px 8px;border-radius:4px;font-size:0.85em;">'
-                        f'一般正式出貨使用</span>',
+                        _BADGE_PRIORITY_TMPL.format(name=rate["service_name"]),
                         unsafe_allow_html=True,
                     )
                 else:
@@ -613,33 +838,19 @@ def _render_international_flow(products: dict):
 
                 left, right = st.columns([3, 1])
                 with left:
-                    c1, c2, c3 = st.columns(3)
-                    c1.metric("運費成本 Shipping Cost", f"NT$ {cost_ntd:,.0f}")
-                    c2.metric("美金成本 USD Cost", f"US$ {usd_cost:,.2f}")
-                    c3.metric(
-                        f"報價金額 Quote (+{current_markup:.0f}%)",
-                        f"US$ {quoted_usd:,.2f}",
-                    )
-
-                    c4, c5 = st.columns(2)
-                    c4.metric("每KG成本 Cost/KG", f"NT$ {cost_per_kg:,.2f}")
-                    c5.metric("預計天數 Transit Days", rate["transit_days"])
-
-                    if st.button(
-                        "儲存此報價 Save Quote",
-                        key=f"save_intl_{i}_{rate['service_type']}",
-                    ):
-                        _save_quote_common(query, {
-                            "service_type": rate["service_type"],
-                            "service_name": rate["service_name"],
-                            "shipping_cost_ntd": cost_ntd,
-                            "exchange_rate": current_exchange,
-                            "usd_cost": round(usd_cost, 2),
-                            "markup_percent": current_markup,
-                            "quoted_price_usd": round(quoted_usd, 2),
-                            "cost_per_kg_ntd": round(cost_per_kg, 2),
-                        }, "international")
-                        st.success("報價已儲存! Quote saved!")
+                    st.markdown(card_html, unsafe_allow_html=True)
+
+                    rate_data = {
+                        "service_type": rate["service_type"],
+                        "service_name": rate["service_name"],
+                        "shipping_cost_ntd": cost_ntd,
+                        "exchange_rate": current_exchange,
+                        "usd_cost": round(usd_cost, 2),
+                        "markup_percent": current_markup,
+                        "quoted_price_usd": round(quoted_usd, 2),
+                        "cost_per_kg_ntd": round(cost_per_kg, 2),
+                    }
+                    save_options.append((f"{rate['service_name']} — US$ {quoted_usd:,.2f}", rate_data))
 
                 with right:
                     markup_mult = 1 + current_markup / 100
@@ -650,6 +861,8 @@ def _render_international_flow(products: dict):
                     )
                     st.code(copy_text, language=None)
 
+        _render_save_selected(query, save_options, "international", pfx)
+
 
 # ---------------------------------------------------------------------------
 # Domestic flow
@@ -658,26 +871,13 @@ def _render_international_flow(products: dict):
 def _render_domestic_flow(products: dict):
     pfx = "dom"
 
-    prefill = st.session_state.pop("prefill_dom", None)
-    prefill_products = []
-    if prefill:
-        st.info("已從歷史紀錄帶入資料，請修改後重新查詢。\nData loaded from history. Please modify and re-query.")
-        prefill_products = _parse_prefill_products(prefill)
+    prefill, prefill_products = _load_prefill("prefill_dom")
 
     # ── 1. Product & Quantity ──
     product_result = _render_product_section(products, prefill, prefill_products, pfx)
     if product_result is None:
         return
-    product_entries, total_cartons, total_weight_kg, total_sets = product_result
-
-    extra_weight = st.number_input(
-        "額外重量 Extra Weight (kg)",
-        min_value=0.0,
-        value=0.5,
-        step=0.1,
-        format="%.1f",
-        key=f"{pfx}_extra_weight",
-    )
+    product_entries, total_cartons, total_weight_kg, total_sets, extra_weight = product_result
 
     combined_weight = total_weight_kg + extra_weight
     st.metric("合計重量 Combined Weight", f"{combined_weight:.1f} kg")
@@ -686,20 +886,14 @@ def _render_domestic_flow(products: dict):
 
     # ── 2. Sender ──
     st.subheader("2. 寄件地 Sender")
-    sender_labels = [
-        f"{name} ({info['zip']})"
-        for name, info in config.DOMESTIC_SENDERS.items()
-    ] + ["Custom ZIP 自訂"]
-
     sender_choice = st.radio(
         "寄件倉庫 Sender Warehouse",
-        sender_labels,
+        _SENDER_LABELS,
         horizontal=True,
         key=f"{pfx}_sender_choice",
     )
 
-    sender_address = None
-    if sender_choice == "Custom ZIP 自訂":
+    if sender_choice == _CUSTOM_SENDER_LABEL:
         custom_zip = st.text_input(
             "自訂寄件 ZIP Custom Sender ZIP",
             placeholder="10001",
@@ -713,10 +907,7 @@ def _render_domestic_flow(products: dict):
             "country": "US",
         }
     else:
-        for name, info in config.DOMESTIC_SENDERS.items():
-            if sender_choice.startswith(name):
-                sender_address = info
-                break
+        sender_address = _SENDER_BY_LABEL.get(sender_choice)
 
     st.divider()
 
@@ -747,7 +938,8 @@ def _render_domestic_flow(products: dict):
         fixed_basic_cost = auto_fixed
 
     # ── Clear stale results ──
-    _clear_old_results_if_changed(product_entries, dest_zip, dest_state, f"{pfx}_last_query")
+    query_key = _query_key(product_entries, dest_zip, dest_state)
+    _clear_old_results_if_changed(query_key, f"{pfx}_last_query")
 
     # ── Query Button ──
     if st.button("查詢 Shippo 運費 Get Domestic Rates", type="primary", use_container_width=True, key=f"{pfx}_query_btn"):
@@ -758,6 +950,9 @@ def _render_domestic_flow(products: dict):
             st.error("請輸入目的地 ZIP Code\nPlease enter a destination ZIP Code")
             return
 
+        # Imported on first query so other pages/tabs don't load the Shippo client
+        from services.shippo_api import get_domestic_rates, parse_shippo_rates
+
         parcels = _build_shippo_parcels(total_cartons, combined_weight)
 
         combined_shipment = {
@@ -779,10 +974,11 @@ def _render_domestic_flow(products: dict):
                     return
 
                 st.session_state[f"{pfx}_last_rates"] = rates
+                st.session_state.pop(f"{pfx}_save_pick", None)
                 st.session_state[f"{pfx}_last_query"] = {
                     "shipping_type": "domestic",
                     "product_entries": product_entries,
-                    "products_key": [(e["model"], e["quantity_sets"]) for e in product_entries],
+                    "query_key": query_key,
                     "combined_shipment": combined_shipment,
                     "dest_state": dest_state,
                     "dest_zip": dest_zip,
@@ -803,8 +999,15 @@ def _render_domestic_flow(products: dict):
                 return
 
     # ── 4. 運費報價 Rate Results ──
+    _render_dom_results(pfx, fixed_basic_cost, total_sets)
+
+
+@st.fragment
+def _render_dom_results(pfx, fixed_basic_cost, total_sets):
+    """Domestic rate cards. A fragment, so Save/Select clicks rerun only this block."""
     if f"{pfx}_last_rates" in st.session_state and f"{pfx}_last_query" in st.session_state:
         st.subheader("4. 運費報價 Shipping Rates")
+        st.markdown(_RATE_CARD_CSS, unsafe_allow_html=True)
 
         query = st.session_state[f"{pfx}_last_query"]
         rates = st.session_state[f"{pfx}_last_rates"]
@@ -815,9 +1018,28 @@ def _render_domestic_flow(products: dict):
             f"${effective_fixed:.0f} (fixed, {total_sets} sets)"
         )
 
-        for i, rate in enumerate(rates):
+        # Quoted prices and card HTML depend only on the rates and the fixed fee; reuse them across reruns
+        calc = st.session_state.get(f"{pfx}_rate_calc")
+        if calc is None or calc["rates"] is not rates or calc["key"] != effective_fixed:
+            quoted = [round(r["amount_usd"] * config.DOMESTIC_MARKUP + effective_fixed, 2) for r in rates]
+            calc = {
+                "rates": rates,
+                "key": effective_fixed,
+                "figures": quoted,
+                "cards": [
+                    _metric_grid([
+                        ("Shippo 成本 Cost", f"US$ {r['amount_usd']:,.2f}"),
+                        ("報價金額 Quoted Price", f"US$ {q:,.2f}"),
+                        ("預計天數 Transit Days", r["estimated_days"]),
+                    ])
+                    for r, q in zip(rates, quoted)
+                ],
+            }
+            st.session_state[f"{pfx}_rate_calc"] = calc
+
+        save_options = []  # (picker label, rate_data) per card, saved via _render_save_selected
+        for rate, quoted_usd, card_html in zip(rates, calc["figures"], calc["cards"]):
             shippo_cost = rate["amount_usd"]
-            quoted_usd = round(shippo_cost * config.DOMESTIC_MARKUP + effective_fixed, 2)
 
             with st.container(border=True):
                 # Provider + service + account as heading
@@ -829,30 +1051,23 @@ def _render_domestic_flow(products: dict):
 
                 left, right = st.columns([3, 1])
                 with left:
-                    c1, c2, c3 = st.columns(3)
-                    c1.metric("Shippo 成本 Cost", f"US$ {shippo_cost:,.2f}")
-                    c2.metric("報價金額 Quoted Price", f"US$ {quoted_usd:,.2f}")
-                    c3.metric("預計天數 Transit Days", rate["estimated_days"])
+                    st.markdown(card_html, unsafe_allow_html=True)
 
                     st.caption(
                         f"${shippo_cost:,.2f} × {config.DOMESTIC_MARKUP} + ${effective_fixed:.0f} = ${quoted_usd:,.2f}"
                     )
 
-                    if st.button(
-                        "儲存此報價 Save Quote",
-                        key=f"save_dom_{i}_{rate['service_token']}",
-                    ):
-                        _save_quote_common(query, {
-                            "service_type": rate["service_token"],
-                            "service_name": f"{rate['provider']} {rate['service_name']}",
-                            "shipping_cost_ntd": 0,
-                            "exchange_rate": 0,
-                            "usd_cost": round(shippo_cost, 2),
-                            "markup_percent": 0,
-                            "quoted_price_usd": quoted_usd,
-                            "cost_per_kg_ntd": 0,
-                        }, "domestic")
-                        st.success("報價已儲存! Quote saved!")
+                    rate_data = {
+                        "service_type": rate["service_token"],
+                        "service_name": f"{rate['provider']} {rate['service_name']}",
+                        "shipping_cost_ntd": 0,
+                        "exchange_rate": 0,
+                        "usd_cost": round(shippo_cost, 2),
+                        "markup_percent": 0,
+                        "quoted_price_usd": quoted_usd,
+                        "cost_per_kg_ntd": 0,
+                    }
+                    save_options.append((f"{rate_data['service_name']}{acct_label} — US$ {quoted_usd:,.2f}", rate_data))
 
                 with right:
                     dom_combined_weight = query["combined_shipment"]["total_weight_kg"]
@@ -864,6 +1079,8 @@ def _render_domestic_flow(products: dict):
                     )
                     st.code(copy_text, language=None)
 
+        _render_save_selected(query, save_options, "domestic", pfx)
+
 
 # ---------------------------------------------------------------------------
 # Ocean (Projects) flow
@@ -872,26 +1089,13 @@ def _render_domestic_flow(products: dict):
 def _render_ocean_flow(products: dict):
     pfx = "ocean"
 
-    prefill = st.session_state.pop("prefill_ocean", None)
-    prefill_products = []
-    if prefill:
-        st.info("已從歷史紀錄帶入資料，請修改後重新查詢。\nData loaded from history. Please modify and re-query.")
-        prefill_products = _parse_prefill_products(prefill)
+    prefill, prefill_products = _load_prefill("prefill_ocean")
 
     # ── 1. Product & Quantity ──
     product_result = _render_product_section(products, prefill, prefill_products, pfx)
     if product_result is None:
         return
-    product_entries, total_cartons, total_weight_kg, total_sets = product_result
-
-    extra_weight = st.number_input(
-        "額外重量 Extra Weight (kg)",
-        min_value=0.0,
-        value=0.5,
-        step=0.1,
-        format="%.1f",
-        key=f"{pfx}_extra_weight",
-    )
+    product_entries, total_cartons, total_weight_kg, total_sets, extra_weight = product_result
 
     combined_weight = total_weight_kg + extra_weight
     st.metric("合計重量 Combined Weight", f"{combined_weight:.1f} kg")